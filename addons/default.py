@@ -1,3 +1,5 @@
+import asyncio
+
 import dico  # noqa
 import dico_command
 import dico_interaction as dico_inter
@@ -7,6 +9,21 @@ from humanize import naturalsize
 import utils
 from models import ChorokBot, Colors
 
+PLACEMENT_KINDS = {
+    "preferred": "같은 지역",
+    "fallback": "다른 지역",
+    "rerouted": "재배치",
+    "placed": "배치",
+}
+
+SHARD_STATES = {
+    "connecting": "연결 중",
+    "ready": "정상",
+    "resumed": "정상 (재개됨)",
+    "reconnecting": "재연결 중",
+    "closed": "종료됨",
+}
+
 
 def load(bot: ChorokBot) -> None:
     bot.load_addons(Default)
@@ -16,6 +33,14 @@ def unload(bot: ChorokBot) -> None:
     bot.unload_addons(Default)
 
 
+async def on_guild(ctx: dico_inter.InteractionContext) -> bool:
+    if ctx.guild_id is None:
+        ctx.client.loop.create_task(  # noqa
+            ctx.send("이 명령어는 초록이 있는 서버에서만 사용할 수 있습니다.", ephemeral=True))
+        return False
+    return True
+
+
 class Default(dico_command.Addon):  # type: ignore[call-arg, misc]
     bot: ChorokBot
     name = "기본"
@@ -28,6 +53,71 @@ class Default(dico_command.Addon):  # type: ignore[call-arg, misc]
             value=f"{len(self.bot.audio.voice_clients)}/{self.bot.guild_count} (노래를 재생중인 서버/총 서버)",
         )
 
+        for node in self.bot.audio.nodes:
+            stats = node.scheduler.stats()
+            embed.add_field(
+                name=f"노드 {node.key}",
+                value="\n".join(
+                    f"{lane}: {int(stat['in_flight'])} 처리 중, {int(stat['waiting'])} 대기 중, "
+                    f"평균 대기 {round(stat['avg_wait'] * 1000)}ms"
+                    for lane, stat in stats.items()),
+                inline=False,
+            )
+
+        placements = self.bot.audio.placement_stats()
+        if placements:
+            embed.add_field(
+                name="노드 배치",
+                value="\n".join(
+                    f"{region}: " + ", ".join(
+                        f"{PLACEMENT_KINDS.get(kind, kind)} {count}회"
+                        for kind, count in stats.items())
+                    for region, stats in placements.items()),
+                inline=False,
+            )
+
+        if self.bot.autoscaler:
+            embed.add_field(
+                name="자동 확장",
+                value=f"부하: {round(self.bot.autoscaler.load * 100)}%\n"
+                f"추가된 로컬 노드: {len(self.bot.autoscaler.scaled_nodes)}개 "
+                f"(최대 {self.bot.autoscaler.max_cores}코어)",
+                inline=False,
+            )
+
+        if self.bot.interaction_server:
+            stats = self.bot.interaction_server.stats
+            embed.add_field(
+                name="HTTP 명령어",
+                value=f"받음: {stats['received']}회, 지연 응답: {stats['deferred']}회, "
+                f"서명 오류: {stats['rejected']}회",
+                inline=False,
+            )
+
+        gaps = self.bot.prefetcher.stats()
+        embed.add_field(
+            name="곡 전환",
+            value=f"간격: p50 {round(gaps['p50'] * 1000)}ms, p99 {round(gaps['p99'] * 1000)}ms, "
+            f"최대 {round(gaps['max'] * 1000)}ms\n"
+            f"미리 불러옴: {int(gaps.get('swapped', 0))}곡, 실패: {int(gaps.get('failed', 0))}곡",
+            inline=False,
+        )
+
+        lag = self.bot.watchdog.stats()
+        embed.add_field(
+            name="이벤트 루프",
+            value=f"지연: p50 {round(lag['p50'] * 1000)}ms, p99 {round(lag['p99'] * 1000)}ms, "
+            f"최대 {round(lag['max'] * 1000)}ms\n"
+            f"멈춤: {int(lag['blocked'])}회",
+            inline=False,
+        )
+
+        embed.add_field(
+            name="로그",
+            value=f"버려진 기록: {self.bot.log_handler.dropped}개",
+            inline=False,
+        )
+
         memory = psutil.virtual_memory()
         embed.add_field(
             name="서버",
@@ -38,12 +128,62 @@ class Default(dico_command.Addon):  # type: ignore[call-arg, misc]
 
         await ctx.send(embed=embed)
 
+    @dico_inter.command(name="stats", description="서버와 전체의 재생 통계를 확인합니다.")
+    @dico_inter.deco.checks(on_guild)
+    async def _stats(self, ctx: dico_inter.InteractionContext) -> None:
+        await ctx.defer()
+
+        # aggregated when written, nothing here scans the history
+        history = self.bot.history
+        guild_tracks, global_tracks, times = await asyncio.gather(
+            history.top_tracks(int(ctx.guild_id), 5),
+            history.top_tracks(None, 5),
+            history.listening_time(int(ctx.guild_id)),
+        )
+        guild_time, global_time = times
+
+        def format_tracks(tracks: list[tuple[str, str, int]]) -> str:
+            return "\n".join(
+                f"{index}. [{title}]({url}) - {count}회"
+                for index, (title, url, count) in enumerate(tracks, 1)
+            ) or "아직 재생한 노래가 없습니다."
+
+        embed = dico.Embed(title="통계", color=Colors.information)
+        embed.add_field(
+            name="이 서버",
+            value=f"재생 시간: {utils.formatter.duration_format(guild_time)}\n" +
+            format_tracks(guild_tracks),
+            inline=False,
+        )
+        embed.add_field(
+            name="전체",
+            value=f"재생 시간: {utils.formatter.duration_format(global_time)}\n" +
+            format_tracks(global_tracks),
+            inline=False,
+        )
+
+        await ctx.send(embed=embed)
+
     @dico_inter.command(name="ping", description="봇의 명령어 응답 속도를 확인합니다.")
     async def _ping(self, ctx: dico_inter.InteractionContext) -> None:
+        shard_id = self.bot.get_shard_id(ctx.guild_id)
+        health = self.bot.shard_manager.health().get(shard_id)
+        stats = self.bot.shard_manager.stats()
+        description = (
+            f"**Discord 게이트웨이:** `{round(self.bot.get_shard(ctx.guild_id).ping * 1000)}ms"
+            f"({shard_id + 1}호기)`")
+        if health:
+            description += (
+                f"\n**상태:** {SHARD_STATES.get(health['state'], health['state'])}, "
+                f"재연결 {health['reconnects']}회")
+        description += (
+            f"\n**전체 샤드:** {int(stats['ready'])}/{int(stats['total'])} 정상, "
+            f"평균 {round(stats['latency'] * 1000)}ms, 재연결 {int(stats['reconnects'])}회"
+        )
+
         await ctx.send(embed=dico.Embed(
             title="퐁!",
-            description=f"**Discord 게이트웨이:** `{round(self.bot.get_shard(ctx.guild_id).ping * 1000)}ms"
-            f"({self.bot.get_shard_id(ctx.guild_id) + 1}호기)`",
+            description=description,
             color=Colors.information,
         ))
 
@@ -64,6 +204,32 @@ class Default(dico_command.Addon):  # type: ignore[call-arg, misc]
             color=Colors.information,
         ))
 
+    @dico_inter.command(name="reload", description="설정 파일을 다시 불러옵니다. (관리자 전용)")
+    async def _reload(self, ctx: dico_inter.InteractionContext) -> None:
+        user = getattr(ctx.author, "user", ctx.author)
+        if str(user.id) not in map(str, self.bot.config.get("owners", [])):
+            await ctx.send("이 명령어는 봇 관리자만 사용할 수 있습니다.", ephemeral=True)
+            return
+        if not self.bot.config_path or not self.bot.config_mode:
+            await ctx.send("설정 파일 경로를 알 수 없습니다.", ephemeral=True)
+            return
+
+        await ctx.defer(ephemeral=True)
+        try:
+            await self.bot.reload_config(
+                utils.config.load(self.bot.config_path,
+                                  self.bot.config_mode))
+        except utils.config.ConfigError as exc:
+            await ctx.send(embed=dico.Embed(title="설정을 불러오지 못했습니다.",
+                                            description=f"```{exc}```",
+                                            color=Colors.error))
+            return
+
+        await ctx.send(embed=dico.Embed(
+            description=f"설정을 다시 불러왔습니다. (노드 {len(self.bot.node_tasks)}개)",
+            color=Colors.information,
+        ))
+
     @dico_inter.command(name="help", description="도움말을 확인합니다.")
     async def _help(self, ctx: dico_inter.InteractionContext) -> None:
         embed = dico.Embed(
@@ -1,7 +1,8 @@
 import asyncio
 import contextlib
+import enum
 from http.client import HTTPException
-from typing import Any, Optional, Union
+from typing import Any, Iterable, Optional, Union
 
 import dico  # noqa
 import dico_command
@@ -11,6 +12,51 @@ from discodo.client.models import AudioData, AudioSource  # noqa
 
 from models import ChorokBot, Colors
 from utils.formatter import create_page, duration_format, make_progress_bar
+from utils import queue_ops
+from utils.nowplaying import NowPlayingUpdater, Panel
+from utils.tracing import detached, span, traced
+
+
+class LoopMode(str, enum.Enum):
+    off = "off"
+    one = "one"
+    queue = "queue"
+
+    @classmethod
+    def from_context(cls, value: Any) -> "LoopMode":
+        # previous versions stored loop as a boolean
+        if isinstance(value, bool) or value is None:
+            return cls.queue if value else cls.off
+        return cls(value)
+
+
+def make_nowplaying_embed(vc: discodo.VoiceClient,
+                          position: float) -> dico.Embed:
+    chapters = list(
+        filter(
+            lambda x: x["start_time"] <= position < x["end_time"],
+            vc.current.get("chapters", []),
+        ))
+    chapter = chapters[0] if chapters else None
+    chapter_str = (
+        f"**{chapter['title']}** "
+        f"`[{duration_format(chapter['start_time'])} ~ {duration_format(chapter['end_time'])}]`\n\n" if chapter else ""
+    )
+    progress_bar = (
+        f"{make_progress_bar(position, vc.duration)} "
+        f"`[{duration_format(position)}/{duration_format(vc.duration)}]`"
+        if not vc.current.is_live else "`[🔴LIVE]`")
+    embed = dico.Embed(
+        title=f"{vc.current.title}",
+        url=f"{vc.current.webpage_url}&t={int(position)}",
+        description=f"{chapter_str}\n{progress_bar}",
+        color=Colors.information,
+    )
+    embed.set_author(name="현재 재생 중인 노래")
+    if vc.current.thumbnail:
+        embed.set_thumbnail(url=vc.current.thumbnail)
+
+    return embed
 
 
 def load(bot: ChorokBot) -> None:
@@ -68,34 +114,109 @@ class Music(dico_command.Addon):  # type: ignore[call-arg, misc]
     name = "뮤직"
 
     def on_load(self) -> None:
+        self.panels = NowPlayingUpdater(self.bot, self.render_panel)
+        self.panels.start()
+        # tag of queue entry -> id of the user who requested it
+        self.requesters: dict[str, int] = {}
+        # guild id -> tags in requesters, to forget them with the queue
+        self.requested_tags: dict[int, set[str]] = {}
+        # guild id -> tag of the copy queued to repeat the current track
+        self.repeats: dict[int, str] = {}
+
         self.bot.audio.dispatcher.on("SOURCE_START", self.send_next_source)
+        self.bot.audio.dispatcher.on("SOURCE_START", self.repeat_one)
         self.bot.audio.dispatcher.on("SOURCE_STOP", self.set_loop)
+        self.bot.audio.dispatcher.on("SOURCE_STOP", self.sync_panel)
+        self.bot.audio.dispatcher.on("QUEUE_SWAPPED", self.move_requesters)
+        self.bot.audio.dispatcher.on("VC_DESTROYED", self.clear_guild)
+
+        self.autocompletes = [
+            dico_inter.AutoComplete(self.complete_query, name, None, None,
+                                    "query") for name in ("play", "search")
+        ]
+        for autocomplete in self.autocompletes:
+            self.bot.interaction.add_autocomplete(autocomplete)
 
     def on_unload(self) -> None:
+        self.panels.stop()
+
         self.bot.audio.dispatcher.off("SOURCE_START", self.send_next_source)
+        self.bot.audio.dispatcher.off("SOURCE_START", self.repeat_one)
         self.bot.audio.dispatcher.off("SOURCE_STOP", self.set_loop)
+        self.bot.audio.dispatcher.off("SOURCE_STOP", self.sync_panel)
+        self.bot.audio.dispatcher.off("QUEUE_SWAPPED", self.move_requesters)
+        self.bot.audio.dispatcher.off("VC_DESTROYED", self.clear_guild)
+
+        for autocomplete in self.autocompletes:
+            self.bot.interaction.remove_autocomplete(autocomplete)
 
+    def render_panel(self, panel: Panel) -> Optional[dico.Embed]:
+        vc: discodo.VoiceClient = self.bot.audio.get_vc(panel.guild_id,
+                                                        safe=True)
+        # there is no current track between two tracks or while the node reconnects,
+        # the panel is removed with the voice client
+        if not vc or not vc.current:
+            return None
+
+        if vc.current.tag != panel.tag:
+            panel.tag = vc.current.tag
+            panel.sync(vc.position, vc.duration)
+        return make_nowplaying_embed(vc, panel.current_position)
+
+    async def sync_panel(self, voice: discodo.VoiceClient,
+                         data: dict[str, Any]) -> None:
+        # the next track got SOURCE_START while this one still played, it is the current one only now
+        if not self.panels.get(voice.guild_id):
+            return
+        await voice.getCurrent()
+        self.panels.refresh(voice.guild_id)
+
+    async def complete_query(self, ctx: dico_inter.InteractionContext) -> None:
+        # answered from the index only, a node request could miss the deadline
+        focused = next(option for option in ctx.data.options
+                       if option.focused)
+        choices = self.bot.completions.complete(
+            ctx.guild_id and int(ctx.guild_id), str(focused.value or ""))
+        await ctx.send(choices=[
+            dico.ApplicationCommandOptionChoice(label, value)
+            for label, value in choices
+        ])
+
+    @traced("music.connect_voice")
     async def connect_voice(
             self, guild_id: dico.Snowflake, voice_channel: dico.Snowflake,
             text_channel_id: dico.Snowflake) -> discodo.VoiceClient:
         try:
             vc = await self.bot.audio.connect(guild_id, voice_channel)
         except discodo.NodeNotConnected:
-            await self.bot.audio.nodes[0].connect()
+            with detached():
+                await self.bot.audio.nodes[0].connect()
             vc = await self.bot.audio.connect(guild_id, voice_channel)
 
-        with contextlib.suppress(Exception):
+        with span("discord.modify_guild_member"), contextlib.suppress(
+                Exception):
             await self.bot.modify_guild_member(guild_id,
                                                self.bot.application_id,
                                                mute=False,
                                                deaf=True)
 
+        settings = await self.bot.settings.get(guild_id)
         await vc.setContext({
             "textChannel": int(text_channel_id),
+            "loop": settings["loop"],
         })
+        # stored settings are applied at once instead of one request each
+        options = {
+            key: settings[key]
+            for key in ("volume", "autoplay")
+            if settings[key] != getattr(vc, key)
+        }
+        if options:
+            await vc.setOptions(**options)
 
         return vc
 
+    @traced("event.SOURCE_START")
     async def send_next_source(self, voice: discodo.VoiceClient,
                                data: dict[str, Any]) -> None:
         with contextlib.suppress(Exception):
@@ -112,13 +233,86 @@ class Music(dico_command.Addon):  # type: ignore[call-arg, misc]
         voice.context["lastMessage"] = str(message.id)
         await voice.setContext(voice.context)
 
+    def remember_requester(self, data: Union[AudioData, list[AudioData]],
+                           user_id: dico.Snowflake) -> None:
+        for item in (data if isinstance(data, list) else [data]):
+            self.requesters[item.tag] = int(user_id)
+            self.requested_tags.setdefault(int(item.VoiceClient.guild_id),
+                                           set()).add(item.tag)
+
+    def forget_requesters(self, guild_id: int, tags: Iterable[str]) -> None:
+        requested = self.requested_tags.get(int(guild_id), set())
+        for tag in tags:
+            self.requesters.pop(tag, None)
+            requested.discard(tag)
+        if not requested:
+            self.requested_tags.pop(int(guild_id), None)
+
+    async def move_requesters(self, voice: discodo.VoiceClient,
+                              data: dict[str, Any]) -> None:
+        for old_tag, new_tag in data["tags"].items():
+            if old_tag in self.requesters:
+                requester = self.requesters[old_tag]
+                self.forget_requesters(voice.guild_id, [old_tag])
+                self.requesters[new_tag] = requester
+                self.requested_tags.setdefault(int(voice.guild_id),
+                                               set()).add(new_tag)
+
+    async def clear_guild(self, guild_id: int, data: dict[str, Any]) -> None:
+        self.forget_requesters(guild_id,
+                               list(self.requested_tags.get(guild_id, ())))
+        self.repeats.pop(guild_id, None)
+        self.panels.remove(guild_id)
+
+    async def queue_repeat(self, voice: discodo.VoiceClient,
+                           source: Any) -> None:
+        # a preloaded track starts while it is still Queue[0], the copy goes right behind it
+        index = 1 if voice.Queue and voice.Queue[0].tag == source["tag"] else 0
+        item: AudioData = await self.bot.audio.requeue_source(voice,
+                                                              source,
+                                                              index=index)
+        if isinstance(item, list):
+            return
+        self.repeats[int(voice.guild_id)] = item.tag
+        requester = self.requesters.get(source["tag"])
+        if requester:
+            self.remember_requester(item, requester)
+
+    async def cancel_repeat(self, voice: discodo.VoiceClient) -> None:
+        tag = self.repeats.pop(int(voice.guild_id), None)
+        for item in voice.Queue:
+            if item.tag == tag:
+                await item.remove()
+                self.forget_requesters(voice.guild_id, [tag])
+                break
+
+    @traced("event.SOURCE_START")
+    async def repeat_one(self, voice: discodo.VoiceClient,
+                         data: dict[str, Any]) -> None:
+        # the copy is queued when the track starts, so it is there before the node preloads the next entry
+        self.repeats.pop(int(voice.guild_id), None)
+        if LoopMode.from_context(voice.context.get("loop")) != LoopMode.one:
+            return
+        await self.queue_repeat(voice, data["source"])
+
+    @traced("event.SOURCE_STOP")
     async def set_loop(self, voice: discodo.VoiceClient,
                        data: dict[str, Any]) -> None:
-        if voice.context.get("loop", False):
-            await voice.loadSource(data["source"]["webpage_url"])
+        requester = self.requesters.get(data["source"]["tag"])
+        self.forget_requesters(voice.guild_id, [data["source"]["tag"]])
+
+        # one track is repeated by repeat_one
+        if LoopMode.from_context(voice.context.get("loop")) != LoopMode.queue:
+            return
+
+        source: AudioData = await self.bot.audio.requeue_source(
+            voice, data["source"])
+        if requester and not isinstance(source, list):
+            self.remember_requester(source, requester)
 
     @dico_inter.command(name="join", description="음성 채널에 입장합니다.")
     @dico_inter.deco.checks(on_voice_channel)
+    @traced("command.join")
     async def _join(self, ctx: dico_inter.InteractionContext) -> None:
         await ctx.defer()
 
@@ -135,14 +329,19 @@ class Music(dico_command.Addon):  # type: ignore[call-arg, misc]
         description="노래를 재생합니다.",
         options=[
             dico.ApplicationCommandOption(
-                dico.ApplicationCommandOptionType.STRING, "query",
-                "검색할 내용이나 링크", True)
+                dico.ApplicationCommandOptionType.STRING,
+                "query",
+                "검색할 내용이나 링크",
+                True,
+                autocomplete=True)
         ],
     )
     @dico_inter.deco.checks(on_voice_channel, on_same_voice_channel)
+    @traced("command.play")
     async def _play(self, ctx: dico_inter.InteractionContext,
                     query: str) -> None:
-        await ctx.defer()
+        with span("interaction.defer"):
+            await ctx.defer()
 
         vc: discodo.VoiceClient = self.bot.audio.get_vc(ctx.guild_id,
                                                         safe=True)
@@ -157,6 +356,9 @@ class Music(dico_command.Addon):  # type: ignore[call-arg, misc]
                 ctx.guild_id, ctx.author.user.voice_state.channel_id,
                 ctx.channel_id)
             data: Union[AudioData, list[AudioData]] = await vc.loadSource(query)
+        self.remember_requester(data, ctx.author.user.id)
+        self.bot.completions.add_query(int(ctx.guild_id), query)
+        self.bot.completions.add_sources(int(ctx.guild_id), data)
 
         if isinstance(data, list):
             embed = dico.Embed(
@@ -171,14 +373,17 @@ class Music(dico_command.Addon):  # type: ignore[call-arg, misc]
                 color=Colors.default,
             )
 
-        await ctx.send(embed=embed)
+        with span("interaction.send"):
+            await ctx.send(embed=embed)
 
     @dico_inter.command(name="재생하기",
                         command_type=dico.ApplicationCommandTypes.MESSAGE)
     @dico_inter.deco.checks(on_voice_channel, on_same_voice_channel)
+    @traced("command.play_context_menu")
     async def _play_context_menu(self,
                                  ctx: dico_inter.InteractionContext) -> None:
-        await ctx.defer()
+        with span("interaction.defer"):
+            await ctx.defer()
 
         vc: discodo.VoiceClient = self.bot.audio.get_vc(ctx.guild_id,
                                                         safe=True)
@@ -193,6 +398,7 @@ class Music(dico_command.Addon):  # type: ignore[call-arg, misc]
                 ctx.guild_id, ctx.author.user.voice_state.channel_id,
                 ctx.channel_id)
             data: Union[AudioData, list[AudioData]] = await vc.loadSource(ctx.target.content)
+        self.remember_requester(data, ctx.author.user.id)
 
         if isinstance(data, list):
             embed = dico.Embed(
@@ -207,18 +413,23 @@ class Music(dico_command.Addon):  # type: ignore[call-arg, misc]
                 color=Colors.default,
             )
 
-        await ctx.send(embed=embed)
+        with span("interaction.send"):
+            await ctx.send(embed=embed)
 
     @dico_inter.command(
         name="search",
         description="노래를 검색 및 재생합니다.",
         options=[
             dico.ApplicationCommandOption(
-                dico.ApplicationCommandOptionType.STRING, "query", "검색할 내용",
-                True)
+                dico.ApplicationCommandOptionType.STRING,
+                "query",
+                "검색할 내용",
+                True,
+                autocomplete=True)
         ],
     )
     @dico_inter.deco.checks(on_voice_channel, on_same_voice_channel)
+    @traced("command.search")
     async def _search(self, ctx: dico_inter.InteractionContext,
                       query: str) -> None:
         await ctx.defer(ephemeral=True)
@@ -258,7 +469,12 @@ class Music(dico_command.Addon):  # type: ignore[call-arg, misc]
                 data.custom_id == data_select.custom_id,
                 timeout=30,
             )
-            await vc.putSource(data[int(inter.data.values[0])])
+            self.remember_requester(
+                await vc.putSource(data[int(inter.data.values[0])]),
+                ctx.author.user.id)
+            self.bot.completions.add_query(int(ctx.guild_id), query)
+            self.bot.completions.add_sources(int(ctx.guild_id),
+                                             data[int(inter.data.values[0])])
             await inter.message.channel.send(embed=dico.Embed(
                 title="대기열에 추가되었습니다.",
                 description=f"[{data[int(inter.data.values[0])].title}]({data[int(inter.data.values[0])].webpage_url})"
@@ -282,6 +498,7 @@ class Music(dico_command.Addon):  # type: ignore[call-arg, misc]
     @dico_inter.command(name="검색하기",
                         command_type=dico.ApplicationCommandTypes.MESSAGE)
     @dico_inter.deco.checks(on_voice_channel, on_same_voice_channel)
+    @traced("command.search_context_menu")
     async def _search_context_menu(self,
                                    ctx: dico_inter.InteractionContext) -> None:
         await ctx.defer(ephemeral=True)
@@ -321,7 +538,9 @@ class Music(dico_command.Addon):  # type: ignore[call-arg, misc]
                 data.custom_id == data_select.custom_id,
                 timeout=30,
             )
-            await vc.putSource(data[int(inter.data.values[0])])
+            self.remember_requester(
+                await vc.putSource(data[int(inter.data.values[0])]),
+                ctx.author.user.id)
             await inter.message.channel.send(embed=dico.Embed(
                 title="대기열에 추가되었습니다.",
                 description=f"[{data[int(inter.data.values[0])].title}]({data[int(inter.data.values[0])].webpage_url})"
@@ -356,12 +575,14 @@ class Music(dico_command.Addon):  # type: ignore[call-arg, misc]
     )
     @dico_inter.deco.checks(on_voice_channel, on_playing,
                             on_same_voice_channel)
+    @traced("command.skip")
     async def _skip(self,
                     ctx: dico_inter.InteractionContext,
                     offset: int = 1) -> None:
         vc: discodo.VoiceClient = self.bot.audio.get_vc(ctx.guild_id)
 
         await vc.skip(offset)
+        self.bot.prefetcher.schedule(vc)
         await ctx.send(embed=dico.Embed(
             description=f"성공적으로{f' {offset}개의' if offset > 1 else ''} 곡을 스킵했습니다.",
             color=Colors.information,
@@ -369,8 +590,10 @@ class Music(dico_command.Addon):  # type: ignore[call-arg, misc]
 
     @dico_inter.command(name="stop", description="대기열을 초기화하고 음성 채널에서 나갑니다.")
     @dico_inter.deco.checks(on_voice_channel, on_same_voice_channel)
+    @traced("command.stop")
     async def _stop(self, ctx: dico_inter.InteractionContext) -> None:
         await self.bot.audio.get_vc(ctx.guild_id).destroy()
+        self.panels.remove(ctx.guild_id)
         await ctx.send(embed=dico.Embed(
             description="대기열을 초기화하고 음성 채널에서 나갔습니다.", color=Colors.information))
 
@@ -388,6 +611,7 @@ class Music(dico_command.Addon):  # type: ignore[call-arg, misc]
     )
     @dico_inter.deco.checks(on_voice_channel, on_playing,
                             on_same_voice_channel)
+    @traced("command.volume")
     async def _volume(self,
                       ctx: dico_inter.InteractionContext,
                       percent: Optional[int] = None) -> None:
@@ -402,6 +626,7 @@ class Music(dico_command.Addon):  # type: ignore[call-arg, misc]
             return
 
         await vc.setVolume(percent / 100)
+        self.bot.settings.update(ctx.guild_id, volume=percent / 100)
         await ctx.send(embed=dico.Embed(
             description=f"볼륨을 **{round(vc.volume * 100, 1)}**%로 설정했습니다.",
             colors=Colors.information,
@@ -421,57 +646,65 @@ class Music(dico_command.Addon):  # type: ignore[call-arg, misc]
     )
     @dico_inter.deco.checks(on_voice_channel, on_playing,
                             on_same_voice_channel)
+    @traced("command.seek")
     async def _seek(self, ctx: dico_inter.InteractionContext,
                     offset: str) -> None:
         vc: discodo.VoiceClient = self.bot.audio.get_vc(ctx.guild_id)
 
-        await vc.seek(
-            sum([
-                int(value) * (60**index)
-                for index, value in enumerate(reversed(offset.split(":")))
-            ]))
+        position = sum([
+            int(value) * (60**index)
+            for index, value in enumerate(reversed(offset.split(":")))
+        ])
+        await vc.seek(position)
+        self.panels.sync(ctx.guild_id, position)
         await ctx.send(embed=dico.Embed(description=f"`{offset}` 부분으로 이동했습니다.",
                                         color=Colors.information))
 
-    @dico_inter.command(name="nowplaying", description="현재 재생중인 노래를 확인합니다")
+    @dico_inter.command(
+        name="nowplaying",
+        description="현재 재생중인 노래를 확인합니다",
+        options=[
+            dico.ApplicationCommandOption(
+                dico.ApplicationCommandOptionType.BOOLEAN,
+                "live",
+                "재생 위치가 계속 갱신되는 패널로 보낼지의 여부",
+                required=False,
+            )
+        ],
+    )
     @dico_inter.deco.checks(on_playing)
-    async def _nowplaying(self, ctx: dico_inter.InteractionContext) -> None:
+    @traced("command.nowplaying")
+    async def _nowplaying(self,
+                          ctx: dico_inter.InteractionContext,
+                          live: bool = False) -> None:
         vc: discodo.VoiceClient = self.bot.audio.get_vc(ctx.guild_id)
 
         if not vc.current:
-            embed = dico.Embed(title="현재 재생중인 노래",
-                               description="현재 재생중인 노래가 없습니다.",
-                               color=Colors.error)
-        else:
-            chapters = list(
-                filter(
-                    lambda x: x["start_time"] <= vc.current.position < x[
-                        "end_time"],
-                    vc.current.get("chapters", []),
-                ))
-            chapter = chapters[0] if chapters else None
-            chapter_str = (
-                f"**{chapter['title']}** "
-                f"`[{duration_format(chapter['start_time'])} ~ {duration_format(chapter['end_time'])}]`\n\n" if chapter else ""
-            )
-            progress_bar = (
-                f"{make_progress_bar(vc.position, vc.duration)} "
-                f"`[{duration_format(vc.position)}/{duration_format(vc.duration)}]`"
-                if not vc.current.is_live else "`[🔴LIVE]`")
-            embed = dico.Embed(
-                title=f"{vc.current.title}",
-                url=f"{vc.current.webpage_url}&t={int(vc.current.position)}",
-                description=f"{chapter_str}\n{progress_bar}",
-                color=Colors.information,
-            )
-            embed.set_author(name="현재 재생 중인 노래")
-            if vc.current.thumbnail:
-                embed.set_thumbnail(url=vc.current.thumbnail)
+            await ctx.send(embed=dico.Embed(title="현재 재생중인 노래",
+                                            description="현재 재생중인 노래가 없습니다.",
+                                            color=Colors.error))
+            return
 
-        await ctx.send(embed=embed)
+        embed = make_nowplaying_embed(vc, vc.position)
+        if not live:
+            await ctx.send(embed=embed)
+            return
+
+        message: dico.Message = await self.bot.create_message(
+            channel=ctx.channel_id, embed=embed)
+        previous = self.panels.add(
+            Panel(int(ctx.guild_id), int(ctx.channel_id), int(message.id),
+                  vc.position, vc.duration, vc.current.tag))
+        if previous:
+            with contextlib.suppress(Exception):
+                await self.bot.delete_message(previous.channel_id,
+                                              previous.message_id)
+
+        await ctx.send("재생 위치가 갱신되는 패널을 만들었습니다.", ephemeral=True)
 
     @dico_inter.command(name="queue", description="서버의 대기열을 확인합니다.")
     @dico_inter.deco.checks(on_playing)
+    @traced("command.queue")
     async def _queue(self, ctx: dico_inter.InteractionContext) -> None:
         vc: discodo.VoiceClient = self.bot.audio.get_vc(ctx.guild_id)
 
@@ -496,70 +729,216 @@ class Music(dico_command.Addon):  # type: ignore[call-arg, misc]
 
         await ctx.send(embeds=embeds)
 
+    async def edit_queue(self, ctx: dico_inter.InteractionContext,
+                         vc: discodo.VoiceClient, new_queue: list[AudioData],
+                         message: str) -> None:
+        old_tags = {item.tag for item in vc.Queue}
+        removed = len(vc.Queue) - len(new_queue)
+        # re-put entries keep their tags, so requesters stay known
+        await queue_ops.apply(vc, new_queue)
+        self.forget_requesters(vc.guild_id,
+                               old_tags - {item.tag for item in new_queue})
+
+        await ctx.send(embed=dico.Embed(
+            description=message.format(removed=removed),
+            color=Colors.information,
+        ))
+
     @dico_inter.command(name="remove",
-                        description="대기열에서 해당 인덱스의 곡을 삭제합니다.",
+                        description="대기열에서 해당 인덱스(또는 범위)의 곡을 삭제합니다.",
                         options=[
                             dico.ApplicationCommandOption(
                                 dico.ApplicationCommandOptionType.NUMBER,
-                                "index", "삭제할 곡의 인덱스", True)
+                                "index", "삭제할 곡의 인덱스", True),
+                            dico.ApplicationCommandOption(
+                                dico.ApplicationCommandOptionType.INTEGER,
+                                "end", "범위로 삭제할 경우 마지막 곡의 인덱스", False),
                         ])
-    async def _remove(self, ctx: dico_inter.InteractionContext,
-                      index: int) -> None:
+    @traced("command.remove")
+    async def _remove(self,
+                      ctx: dico_inter.InteractionContext,
+                      index: int,
+                      end: Optional[int] = None) -> None:
         vc: discodo.VoiceClient = self.bot.audio.get_vc(ctx.guild_id)
+        index = int(index)
+
+        if end is None:
+            with contextlib.suppress(Exception):
+                data: discodo.AudioData = vc.Queue[index - 1]
+                await vc.Queue[index - 1].remove()
+                await ctx.send(embed=dico.Embed(
+                    description=f"[{data.title}]({data.webpage_url})을(를) 삭제했습니다.",
+                    color=Colors.information))
+            return
 
-        with contextlib.suppress(Exception):
-            data: discodo.AudioData = vc.Queue[index - 1]
-            await vc.Queue[index - 1].remove()
-            await ctx.send(embed=dico.Embed(
-                description=f"[{data.title}]({data.webpage_url})을(를) 삭제했습니다.",
-                color=Colors.information))
+        if not 1 <= index <= end <= len(vc.Queue):
+            await ctx.send(f"인덱스는 1부터 {len(vc.Queue)} 사이여야 합니다.",
+                           ephemeral=True)
+            return
+
+        await self.edit_queue(
+            ctx, vc, queue_ops.remove_range(list(vc.Queue), index - 1, end - 1),
+            f"{index}번부터 {end}번까지 {{removed}}개의 곡을 삭제했습니다.")
+
+    @dico_inter.command(name="removeuser",
+                        description="대기열에서 해당 유저가 추가한 곡을 모두 삭제합니다.",
+                        options=[
+                            dico.ApplicationCommandOption(
+                                dico.ApplicationCommandOptionType.USER,
+                                "user", "곡을 삭제할 유저", True)
+                        ])
+    @dico_inter.deco.checks(on_voice_channel, on_playing,
+                            on_same_voice_channel)
+    @traced("command.removeuser")
+    async def _remove_user(self, ctx: dico_inter.InteractionContext,
+                           user: dico.User) -> None:
+        vc: discodo.VoiceClient = self.bot.audio.get_vc(ctx.guild_id)
+
+        await self.edit_queue(
+            ctx, vc,
+            queue_ops.remove_by(
+                list(vc.Queue),
+                lambda item: self.requesters.get(item.tag) == int(user.id)),
+            f"{user.mention}님이 추가한 {{removed}}개의 곡을 삭제했습니다.")
+
+    @dico_inter.command(name="dedupe", description="대기열에서 중복된 곡을 삭제합니다.")
+    @dico_inter.deco.checks(on_voice_channel, on_playing,
+                            on_same_voice_channel)
+    @traced("command.dedupe")
+    async def _dedupe(self, ctx: dico_inter.InteractionContext) -> None:
+        vc: discodo.VoiceClient = self.bot.audio.get_vc(ctx.guild_id)
+
+        await self.edit_queue(
+            ctx, vc,
+            queue_ops.dedupe(list(vc.Queue), lambda item: item.webpage_url),
+            "중복된 {removed}개의 곡을 삭제했습니다.")
+
+    @dico_inter.command(name="move",
+                        description="대기열에서 곡의 위치를 옮깁니다.",
+                        options=[
+                            dico.ApplicationCommandOption(
+                                dico.ApplicationCommandOptionType.INTEGER,
+                                "index", "옮길 곡의 인덱스", True),
+                            dico.ApplicationCommandOption(
+                                dico.ApplicationCommandOptionType.INTEGER,
+                                "to", "옮길 위치", True),
+                        ])
+    @dico_inter.deco.checks(on_voice_channel, on_playing,
+                            on_same_voice_channel)
+    @traced("command.move")
+    async def _move(self, ctx: dico_inter.InteractionContext, index: int,
+                    to: int) -> None:
+        vc: discodo.VoiceClient = self.bot.audio.get_vc(ctx.guild_id)
+
+        if not (1 <= index <= len(vc.Queue) and 1 <= to <= len(vc.Queue)):
+            await ctx.send(f"인덱스는 1부터 {len(vc.Queue)} 사이여야 합니다.",
+                           ephemeral=True)
+            return
+
+        data: discodo.AudioData = vc.Queue[index - 1]
+        await self.edit_queue(
+            ctx, vc, queue_ops.move(list(vc.Queue), index - 1, to - 1),
+            f"[{data.title}]({data.webpage_url})을(를) {to}번으로 옮겼습니다.")
+
+    @dico_inter.command(name="shuffle", description="대기열을 섞습니다.")
+    @dico_inter.deco.checks(on_voice_channel, on_playing,
+                            on_same_voice_channel)
+    @traced("command.shuffle")
+    async def _shuffle(self, ctx: dico_inter.InteractionContext) -> None:
+        vc: discodo.VoiceClient = self.bot.audio.get_vc(ctx.guild_id)
+
+        await vc.shuffle()
+        await ctx.send(embed=dico.Embed(
+            description=f"대기열의 {len(vc.Queue)}개의 곡을 섞었습니다.",
+            color=Colors.information,
+        ))
 
     @dico_inter.command(name="autoplay", description="자동 재생을 켜거나 끕니다.")
     @dico_inter.deco.checks(on_voice_channel, on_playing,
                             on_same_voice_channel)
+    @traced("command.autoplay")
     async def _autoplay(self, ctx: dico_inter.InteractionContext) -> None:
         vc: discodo.VoiceClient = self.bot.audio.get_vc(ctx.guild_id)
 
         await vc.setAutoplay(not vc.autoplay)
+        self.bot.settings.update(ctx.guild_id, autoplay=vc.autoplay)
 
         await ctx.send(embed=dico.Embed(
             description=f"자동 재생을 {'켰' if vc.autoplay else '껐'}습니다.",
             color=Colors.information,
         ))
 
-    @dico_inter.command(name="loop", description="대기열 전체 반복을 켜거나 끕니다.")
+    @dico_inter.command(
+        name="loop",
+        description="반복 모드를 설정하거나 대기열 전체 반복을 켜거나 끕니다.",
+        options=[
+            dico.ApplicationCommandOption(
+                dico.ApplicationCommandOptionType.STRING,
+                "mode",
+                "반복 모드",
+                required=False,
+                choices=[
+                    dico.ApplicationCommandOptionChoice("한 곡 반복",
+                                                        LoopMode.one.value),
+                    dico.ApplicationCommandOptionChoice(
+                        "대기열 반복", LoopMode.queue.value),
+                    dico.ApplicationCommandOptionChoice("끄기",
+                                                        LoopMode.off.value),
+                ],
+            )
+        ],
+    )
     @dico_inter.checks(on_voice_channel, on_playing, on_same_voice_channel)
-    async def _loop(self, ctx: dico_inter.InteractionContext) -> None:
+    @traced("command.loop")
+    async def _loop(self,
+                    ctx: dico_inter.InteractionContext,
+                    mode: Optional[str] = None) -> None:
         vc: discodo.VoiceClient = self.bot.audio.get_vc(ctx.guild_id)
 
-        if vc.context.get("loop", False):
-            vc.context["loop"] = False
-        else:
-            vc.context["loop"] = True
+        previous = LoopMode.from_context(vc.context.get("loop"))
+        if mode is None:
+            mode = (LoopMode.off
+                    if previous != LoopMode.off else LoopMode.queue)
+        vc.context["loop"] = LoopMode(mode).value
         await vc.setContext(vc.context)
+        self.bot.settings.update(ctx.guild_id, loop=vc.context["loop"])
+
+        # the current track started already, so its copy is queued or removed here
+        if previous != LoopMode.one and mode == LoopMode.one:
+            await self.queue_repeat(vc, vc.current)
+        elif previous == LoopMode.one and mode != LoopMode.one:
+            await self.cancel_repeat(vc)
 
         await ctx.send(embed=dico.Embed(
-            description=f"대기열 반복을 {'켰' if vc.context['loop'] else '껐'}습니다.",
+            description={
+                LoopMode.off: "반복을 껐습니다.",
+                LoopMode.one: "한 곡 반복을 켰습니다.",
+                LoopMode.queue: "대기열 반복을 켰습니다.",
+            }[LoopMode(mode)],
             color=Colors.information,
         ))
 
     @dico_inter.command(name="pause", description="노래를 일시정지합니다.")
     @dico_inter.deco.checks(on_voice_channel, on_playing,
                             on_same_voice_channel)
+    @traced("command.pause")
     async def _pause(self, ctx: dico_inter.InteractionContext) -> None:
         vc: discodo.VoiceClient = self.bot.audio.get_vc(ctx.guild_id)
 
         await vc.pause()
+        self.panels.pause(ctx.guild_id)
 
         await ctx.send(embed=dico.Embed(description="노래를 일시정지했습니다.",
                                         color=Colors.information))
 
     @dico_inter.command(name="resume", description="노래를 다시 재생합니다.")
     @dico_inter.deco.checks(on_voice_channel, on_same_voice_channel)
+    @traced("command.resume")
     async def _resume(self, ctx: dico_inter.InteractionContext) -> None:
         vc: discodo.VoiceClient = self.bot.audio.get_vc(ctx.guild_id)
 
         await vc.resume()
+        self.panels.resume(ctx.guild_id)
 
         await ctx.send(embed=dico.Embed(description="노래를 다시 재생합니다.",
                                         color=Colors.information))
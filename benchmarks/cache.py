@@ -0,0 +1,90 @@
+"""
+Compares the redis and memory cache backends on the calls the bot makes.
+
+    python -m benchmarks.cache --guilds 1000 --redis localhost:6379
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any, Awaitable, Callable
+
+from benchmarks.loadtest import Recorder
+
+
+async def run(cache: Any, args: argparse.Namespace) -> dict[str, Any]:
+    import utils
+
+    random.seed(args.seed)
+    recorder = Recorder()
+    guilds = [random.randrange(10**17, 10**18) for _ in range(args.guilds)]
+    settings = utils.settings.GuildSettingsStore(cache,
+                                                 max_cached=args.guilds // 2)
+    history = utils.history.PlayHistory(cache)
+
+    async def measure(name: str, func: Callable[[],
+                                                 Awaitable[Any]]) -> None:
+        await recorder.measure(name, func)
+
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        for guild_id in guilds:
+            # half of the guilds don't fit in the in-process copy, so they read through
+            await measure("settings.get",
+                          lambda: settings.get(random.choice(guilds)))
+            settings.update(guild_id, volume=random.random())
+
+            history._buffer.append(
+                utils.history.Play(guild_id, f"track {random.randrange(500)}",
+                                   "https://example.com", 180.0))
+            channel = type("Channel", (), {"id": guild_id})
+            user = type("User", (), {"id": random.randrange(100)})
+            await measure("users.add", lambda: cache.add_user(channel, user))
+            await measure("users.get", lambda: cache.get_users(channel))
+
+        await measure("settings.flush", settings.flush)
+        await measure("history.flush", history.flush)
+        for guild_id in guilds[:100]:
+            await measure("history.top_tracks",
+                          lambda: history.top_tracks(guild_id))
+            await measure("history.listening_time",
+                          lambda: history.listening_time(guild_id))
+        await measure("json.set",
+                      lambda: cache.set_json("benchmark", guilds, 60))
+        await measure("json.pop", lambda: cache.pop_json("benchmark"))
+
+    return {
+        "elapsed_s": time.perf_counter() - started,
+        "calls": recorder.summary(),
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    import utils
+
+    backends = {"memory": utils.cache.CacheClient(backend="memory")}
+    if args.redis:
+        host, _, port = args.redis.partition(":")
+        backends["redis"] = utils.cache.CacheClient(host, int(port or 6379))
+        # starts from an empty database, every key is removed
+        await backends["redis"].backend.flushdb()
+
+    results = {}
+    for name, cache in backends.items():
+        results[name] = await run(cache, args)
+        await cache.close()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--guilds", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--redis",
+        help="host:port of a redis server to compare with, its database is flushed"
+    )
+    asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
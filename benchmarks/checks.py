@@ -0,0 +1,248 @@
+"""
+Scenario checks of the bot against the fake discodo node, whose events come in the order of the real player.
+Tracks end by themselves after a short time, so a check sees the same preloads, stops and autoplay fills.
+
+    python -m benchmarks.checks
+    python -m benchmarks.checks repeat_one
+
+Exits 1 when a check fails.
+"""
+import argparse
+import asyncio
+import sys
+import traceback
+from typing import Any, Awaitable, Callable
+
+from benchmarks.fake_gateway import FakeBot, FakeGateway
+from benchmarks.fake_node import FakeNode, make_source
+
+CHECKS: dict[str, Callable[[], Awaitable[None]]] = {}
+
+
+def check(func: Callable[[], Awaitable[None]]) -> Callable[[], Awaitable[None]]:
+    CHECKS[func.__name__] = func
+    return func
+
+
+class Scenario:
+    """A bot with the Music addon, one synthetic guild and a fake node playing short tracks."""
+    def __init__(self, track_time: float = 0.4, crossfade: float = 0.1) -> None:
+        self.node = FakeNode(resolve_latency=0.01, track_time=track_time)
+        self.crossfade = crossfade
+        # sources of SOURCE_START and SOURCE_STOP as the bot received them
+        self.started: list[dict[str, Any]] = []
+        self.stopped: list[dict[str, Any]] = []
+
+    async def __aenter__(self) -> "Scenario":
+        # the bot modules need the real dependencies, import them only when running
+        import dico_interaction as dico_inter
+
+        import utils
+        from addons.music import Music
+
+        loop = asyncio.get_event_loop()
+        await self.node.start()
+
+        self.bot = bot = FakeBot(loop)
+        bot.audio = utils.discodo.DicoClient(bot)  # type: ignore[attr-defined]
+        bot.settings = utils.settings.GuildSettingsStore(  # type: ignore[attr-defined]
+            utils.cache.CacheClient(backend="memory"))
+        bot.completions = utils.autocomplete.CompletionIndex()  # type: ignore[attr-defined]
+        bot.interaction = dico_inter.InteractionClient(loop=loop)  # type: ignore[attr-defined]
+        bot.prefetcher = utils.prefetch.QueuePrefetcher(bot.audio)  # type: ignore[attr-defined]
+        bot.audio.dispatcher.on(
+            "SOURCE_START",
+            lambda voice, data: self.started.append(data["source"]))
+        bot.audio.dispatcher.on(
+            "SOURCE_STOP",
+            lambda voice, data: self.stopped.append(data["source"]))
+        self.gateway = FakeGateway(bot, 1)
+        self.guild = self.gateway.guilds[0]
+
+        await asyncio.wait([
+            loop.create_task(
+                bot.audio.register_node(  # type: ignore[attr-defined]
+                    host=self.node.host,
+                    port=self.node.port,
+                    password=self.node.password)),
+            loop.create_task(self.gateway.ready()),
+        ])
+        self.music = Music(bot)
+        self.music.on_load()
+
+        self.vc = await self.music.connect_voice(self.guild.id,
+                                                 self.guild.voice_channel_id,
+                                                 self.guild.text_channel_id)
+        self.node.voice_clients[str(self.guild.id)].options[
+            "crossfade"] = self.crossfade
+        return self
+
+    async def __aexit__(self, *_: Any) -> None:
+        self.music.on_unload()
+        self.bot.prefetcher.stop()  # type: ignore[attr-defined]
+        await self.node.stop()
+
+    @staticmethod
+    async def wait_until(predicate: Callable[[], Any],
+                         timeout: float = 10.0) -> None:
+        async def wait() -> None:
+            while not predicate():
+                await asyncio.sleep(0.01)
+
+        await asyncio.wait_for(wait(), timeout)
+
+    async def put(self, *queries: str, extracted: bool = True) -> None:
+        from discodo.client.models import AudioData
+
+        await self.vc.putSource([
+            AudioData(self.vc, make_source(query, extracted=extracted))
+            for query in queries
+        ])
+
+    async def set_loop(self, mode: str) -> None:
+        self.vc.context["loop"] = mode
+        await self.vc.setContext(self.vc.context)
+
+
+@check
+async def repeat_one() -> None:
+    # the node preloads Queue[0] before the current track stops, the copy has to be there first
+    async with Scenario() as scenario:
+        await scenario.set_loop("one")
+        await scenario.put("a", "b")
+        await scenario.wait_until(lambda: len(scenario.started) >= 4)
+        played = [source["webpage_url"] for source in scenario.started[:4]]
+        assert played == [make_source("a")["webpage_url"]] * 4, played
+
+    # with nothing behind it, the copy keeps autoplay from filling the queue
+    async with Scenario() as scenario:
+        await scenario.set_loop("one")
+        await scenario.put("a")
+        await scenario.wait_until(lambda: len(scenario.started) >= 3)
+        assert not any(source["related"] for source in scenario.started)
+
+
+@check
+async def panel_follows_track() -> None:
+    from utils.nowplaying import Panel
+
+    async with Scenario(track_time=0.6, crossfade=0.3) as scenario:
+        await scenario.put("a", "b")
+        await scenario.wait_until(lambda: scenario.started)
+        await scenario.vc.getCurrent()
+        panel = Panel(scenario.guild.id, scenario.guild.text_channel_id, 0,
+                      scenario.vc.position, scenario.vc.duration,
+                      scenario.vc.current.tag)
+        scenario.music.panels.add(panel)
+
+        # b starts while a still plays, the panel stays on a
+        await scenario.wait_until(lambda: len(scenario.started) >= 2)
+        assert scenario.music.render_panel(panel) is not None
+        assert panel.tag == scenario.started[0]["tag"]
+
+        # the panel follows once a stopped
+        await scenario.wait_until(lambda: scenario.stopped)
+        await scenario.wait_until(lambda: scenario.vc.current.tag ==
+                                  scenario.started[1]["tag"])
+        assert scenario.music.render_panel(panel) is not None
+        assert panel.tag == scenario.started[1]["tag"]
+        assert scenario.music.panels.get(scenario.guild.id) is panel
+
+
+@check
+async def prefetch() -> None:
+    async with Scenario(track_time=0.6, crossfade=0.2) as scenario:
+        prefetcher = scenario.bot.prefetcher  # type: ignore[attr-defined]
+        prefetcher.delay = 0.0
+        await scenario.put("a", "b", "c", extracted=False)
+        await scenario.wait_until(lambda: len(prefetcher.gaps) >= 2)
+
+        # c was resolved while a played, b is preloaded by the node
+        assert prefetcher.counts["swapped"] >= 1, prefetcher.counts
+        # every next track started before the previous one stopped
+        assert list(prefetcher.gaps) == [0.0] * len(prefetcher.gaps)
+
+
+@check
+async def autoscaler_relaunch() -> None:
+    from utils.autoscaler import NodeAutoscaler
+
+    async with Scenario() as scenario:
+        audio = scenario.bot.audio  # type: ignore[attr-defined]
+        # launched like discodo, with -m and --config-json
+        audio.node_module = "benchmarks.fake_node"
+        autoscaler = NodeAutoscaler(audio)
+
+        first = await autoscaler.launch()
+        assert first.is_connected and first.process.returncode is None
+        await autoscaler.retire(first)
+        assert first not in audio.nodes
+        assert first.process.returncode is not None
+
+        # a retired node doesn't keep another one from being launched
+        second = await autoscaler.launch()
+        assert second.is_connected and second.process.pid != first.process.pid
+        await autoscaler.retire(second)
+        assert second.process.returncode is not None
+
+
+@check
+async def gateway_voice_states() -> None:
+    from utils.gateway import GatewayState
+
+    def voice_state(guild_id: str, channel_id: Any) -> dict[str, Any]:
+        return {
+            "guild_id": guild_id,
+            "channel_id": channel_id,
+            "user_id": "1",
+            "session_id": "fake",
+            "member": {},
+        }
+
+    # the bot itself plays in two guilds and leaves one of them
+    state = GatewayState()
+    state.update("VOICE_STATE_UPDATE", voice_state("10", "11"))
+    state.update("VOICE_STATE_UPDATE", voice_state("20", "21"))
+    state.update("VOICE_STATE_UPDATE", voice_state("10", None))
+    assert list(state.voice_states) == [("20", "1")], state.voice_states
+
+    state.update("VOICE_STATE_UPDATE", voice_state("30", "31"))
+    restored = GatewayState()
+    restored.load(state.to_dict())
+    assert restored.voice_states == state.voice_states
+
+    state.update("GUILD_DELETE", {"id": "30"})
+    assert list(state.voice_states) == [("20", "1")], state.voice_states
+
+
+async def run(names: list[str]) -> int:
+    failed = 0
+    for name in names:
+        try:
+            await CHECKS[name]()
+        except Exception:  # noqa
+            failed += 1
+            print(f"FAIL {name}", file=sys.stderr)
+            traceback.print_exc()
+        else:
+            print(f"ok   {name}")
+    return failed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("names",
+                        nargs="*",
+                        help=f"checks to run, all of them by default: {', '.join(CHECKS)}")
+    args = parser.parse_args()
+    unknown = set(args.names) - CHECKS.keys()
+    if unknown:
+        parser.error(f"unknown checks: {', '.join(sorted(unknown))}")
+
+    failed = asyncio.get_event_loop().run_until_complete(
+        run(args.names or list(CHECKS)))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Simulated gateway for synthetic guilds.
+FakeBot implements the part of dico.Client that DicoClient, the Music addon and dico's interaction models use,
+and turns voice state updates into the raw payloads discord would send back.
+"""
+import asyncio
+import itertools
+import types
+from typing import Any, Awaitable, Callable, Optional
+
+_snowflakes = itertools.count(100000000000000000)
+
+APPLICATION_COMMAND = 2
+CHAT_INPUT = 1
+STRING = 3
+INTEGER = 4
+
+
+def snowflake() -> int:
+    return next(_snowflakes)
+
+
+class FakeBot:
+    def __init__(self, loop: asyncio.AbstractEventLoop,
+                 voice_latency: float = 0.0) -> None:
+        self.loop = loop
+        self.application_id = snowflake()
+        self.voice_latency = voice_latency
+
+        self.guild_count = 0
+        self.shard_count = 1
+        self.sent_messages = 0
+        # user id -> voice state, what dico.User.voice_state reads
+        self.voice_states: dict[int, types.SimpleNamespace] = {}
+        # no dico cache, the interaction models are built from the payloads only
+        self.has_cache = False
+        self._handlers: dict[str, list[Callable[..., Awaitable[Any]]]] = {}
+        self._ready = asyncio.Event()
+
+    def on_(self, name: str, func: Callable[..., Awaitable[Any]]) -> None:
+        self._handlers.setdefault(name, []).append(func)
+
+    async def dispatch(self, name: str, *args: Any) -> None:
+        await asyncio.gather(*(handler(*args)
+                               for handler in self._handlers.get(name, [])))
+
+    def set_ready(self) -> None:
+        self._ready.set()
+
+    async def wait_ready(self) -> None:
+        await self._ready.wait()
+
+    async def update_voice_state(self,
+                                 guild: Any,
+                                 channel: Optional[Any] = None,
+                                 **_: Any) -> None:
+        self.loop.create_task(self._voice_state_round_trip(
+            int(guild), channel))
+
+    async def _voice_state_round_trip(self, guild_id: int,
+                                      channel_id: Optional[Any]) -> None:
+        await asyncio.sleep(self.voice_latency)
+        await self.dispatch(
+            "raw", {
+                "t": "VOICE_STATE_UPDATE",
+                "op": 0,
+                "d": {
+                    "guild_id": str(guild_id),
+                    "channel_id": str(channel_id) if channel_id else None,
+                    "user_id": str(self.application_id),
+                    "session_id": "fake",
+                },
+            })
+        if channel_id:
+            await self.dispatch(
+                "raw", {
+                    "t": "VOICE_SERVER_UPDATE",
+                    "op": 0,
+                    "d": {
+                        "guild_id": str(guild_id),
+                        "token": "fake",
+                        "endpoint": "fake.discord.media:443",
+                    },
+                })
+
+    async def create_message(self, channel: Any, *_: Any,
+                             **__: Any) -> types.SimpleNamespace:
+        self.sent_messages += 1
+        return types.SimpleNamespace(id=snowflake(), channel_id=channel)
+
+    async def edit_message(self, *_: Any, **__: Any) -> None:
+        self.sent_messages += 1
+
+    async def delete_message(self, *_: Any, **__: Any) -> None:
+        pass
+
+    async def modify_guild_member(self, *_: Any, **__: Any) -> None:
+        pass
+
+    def get_voice_state(self, user: Any) -> Optional[types.SimpleNamespace]:
+        return self.voice_states.get(int(user))
+
+    async def create_interaction_response(self, *_: Any, **__: Any) -> None:
+        self.sent_messages += 1
+
+    async def create_followup_message(self, interaction: Any, *_: Any,
+                                      **__: Any) -> types.SimpleNamespace:
+        self.sent_messages += 1
+        return types.SimpleNamespace(id=snowflake(),
+                                     channel_id=interaction.channel_id)
+
+    async def request_interaction_response(
+            self, interaction: Any, *_: Any,
+            **__: Any) -> types.SimpleNamespace:
+        return types.SimpleNamespace(id=snowflake(),
+                                     channel_id=interaction.channel_id)
+
+
+class SyntheticGuild:
+    def __init__(self) -> None:
+        self.id = snowflake()
+        self.text_channel_id = snowflake()
+        self.voice_channel_id = snowflake()
+        self.member_id = snowflake()
+
+
+class FakeGateway:
+    def __init__(self, bot: FakeBot, guild_count: int) -> None:
+        self.bot = bot
+        self.guilds = [SyntheticGuild() for _ in range(guild_count)]
+        bot.guild_count = guild_count
+        for guild in self.guilds:
+            bot.voice_states[guild.member_id] = types.SimpleNamespace(
+                guild_id=guild.id,
+                user_id=guild.member_id,
+                channel_id=guild.voice_channel_id)
+
+    async def ready(self) -> None:
+        await self.bot.dispatch("raw", {
+            "t": "READY",
+            "op": 0,
+            "d": {
+                "session_id": "fake"
+            }
+        })
+        self.bot.set_ready()
+
+    def interaction(self, guild: SyntheticGuild, name: str,
+                    **options: Any) -> dict[str, Any]:
+        """The INTERACTION_CREATE payload of a slash command used by the member of the guild."""
+        return {
+            "id": str(snowflake()),
+            "application_id": str(self.bot.application_id),
+            "type": APPLICATION_COMMAND,
+            "data": {
+                "id": str(snowflake()),
+                "name": name,
+                "type": CHAT_INPUT,
+                "options": [{
+                    "name": key,
+                    "type": INTEGER if isinstance(value, int) else STRING,
+                    "value": value,
+                } for key, value in options.items()],
+            },
+            "guild_id": str(guild.id),
+            "channel_id": str(guild.text_channel_id),
+            "member": {
+                "user": {
+                    "id": str(guild.member_id),
+                    "username": "member",
+                    "discriminator": "0000",
+                },
+                "roles": [],
+                "joined_at": "2021-01-01T00:00:00+00:00",
+                "deaf": False,
+                "mute": False,
+            },
+            "token": "fake",
+            "version": 1,
+        }
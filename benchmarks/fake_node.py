@@ -0,0 +1,502 @@
+"""
+Stand-in discodo node which speaks the websocket/restful protocol used by discodo.client.Node.
+Sources are generated instead of extracted, so only the resolve latency is simulated.
+Tracks change in the order of the real player: the next entry is preloaded and gets SOURCE_START
+while the current one still plays, SOURCE_STOP comes after it and the entry is popped last.
+
+Run as a module it serves like ``python -m discodo``, for the bot to launch it as a local node.
+
+    python -m benchmarks.fake_node --config-json '{"HOST": "127.0.0.1", "PORT": 8000, "PASSWORD": "hellodiscodo"}'
+"""
+import argparse
+import asyncio
+import json
+import random
+import secrets
+import time
+import uuid
+from typing import Any, Optional
+
+from aiohttp import WSMsgType, web
+
+
+def stream_url(video_id: str) -> str:
+    return f"https://example.invalid/{video_id}?expire={int(time.time()) + 6 * 60 * 60}"
+
+
+def make_source(query: str,
+                duration: float = 180.0,
+                extracted: bool = True) -> dict[str, Any]:
+    video_id = uuid.uuid5(uuid.NAMESPACE_URL, query).hex[:11]
+    source = {
+        "_type": "AudioData",
+        "tag": str(uuid.uuid4()),
+        "id": video_id,
+        "title": f"track {video_id}",
+        "webpage_url": f"https://www.youtube.com/watch?v={video_id}",
+        "thumbnail": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+        "url": stream_url(video_id),
+        "duration": duration,
+        "is_live": False,
+        "is_file": False,
+        "uploader": "fake node",
+        "description": None,
+        "subtitles": {},
+        "chapters": [],
+        "related": False,
+        "context": {},
+        "start_position": 0.0,
+    }
+    if not extracted:
+        # like playlist entries, the stream url is extracted when the entry is loaded
+        del source["url"]
+    return source
+
+
+class FakeVoiceClient:
+    def __init__(self, node: "FakeNode", guild_id: str,
+                 channel_id: Optional[str]) -> None:
+        self.node = node
+        self.id = str(uuid.uuid4())
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+
+        self.context: dict[str, Any] = {}
+        self.options: dict[str, Any] = {
+            "autoplay": True,
+            "volume": 1.0,
+            "crossfade": 10.0,
+            "filter": {},
+        }
+        self.paused = False
+        self.current: Optional[dict[str, Any]] = None
+        self.queue: list[dict[str, Any]] = []
+        # Queue[0] once it got SOURCE_START, it stays in the queue until the current one stops
+        self._next: Optional[dict[str, Any]] = None
+        self._playing: Optional[asyncio.Task] = None  # type: ignore[type-arg]
+
+    def as_current(self) -> Optional[dict[str, Any]]:
+        if not self.current:
+            return None
+        return self.as_source(self.current)
+
+    @staticmethod
+    def as_source(source: dict[str, Any]) -> dict[str, Any]:
+        return {
+            **source,
+            "_type": "AudioSource",
+            "seekable": True,
+            "position": 0.0,
+            "as_of": time.time(),
+        }
+
+    async def queue_event(self, name: str, *args: Any) -> None:
+        await self.node.send("QUEUE_EVENT", {
+            "guild_id": self.guild_id,
+            "name": name,
+            "args": list(args),
+        })
+
+    async def put(self, sources: list[dict[str, Any]]) -> None:
+        for source in sources:
+            self.queue.append(source)
+            await self.queue_event("append", source)
+
+        if not self.current:
+            await self.play_next()
+
+    async def start(self, source: dict[str, Any]) -> None:
+        if not source.get("url"):
+            await self.node.resolve(source["webpage_url"])
+            source["url"] = stream_url(source["id"])
+        await self.node.send("SOURCE_START", {
+            "guild_id": self.guild_id,
+            "source": self.as_source(source)
+        })
+
+    async def preload(self) -> None:
+        if not self.queue and self.current and self.options["autoplay"]:
+            # the node fills an empty queue with a related track by itself
+            related = make_source(f"{self.current['webpage_url']}#related",
+                                  extracted=False)
+            related["related"] = True
+            self.queue.append(related)
+            await self.queue_event("append", related)
+
+        if not self.queue or self._next is self.queue[0]:
+            return
+        self._next = self.queue[0]
+        await self.start(self._next)
+
+    async def play_next(self, offset: int = 1) -> None:
+        for _ in range(min(offset - 1, len(self.queue))):
+            self.queue.pop(0)
+            await self.queue_event("pop", 0)
+
+        if self.current:
+            await self.preload()
+            await self.node.send("SOURCE_STOP", {
+                "guild_id": self.guild_id,
+                "source": self.as_current()
+            })
+            self.current = None
+
+        if self.queue:
+            source = self.queue.pop(0)
+            await self.queue_event("pop", 0)
+            # not preloaded when nothing was playing, or Queue[0] changed since
+            if source is not self._next:
+                await self.start(source)
+            self.current = source
+        self._next = None
+
+        self.stop_playing()
+        if self.current and self.node.track_time:
+            self._playing = asyncio.get_event_loop().create_task(
+                self.play(self.node.track_time))
+
+    async def play(self, length: float) -> None:
+        crossfade = min(length, self.options["crossfade"])
+        await asyncio.sleep(length - crossfade)
+        await self.preload()
+        await asyncio.sleep(crossfade)
+        # play_next replaces the task, it mustn't cancel itself
+        self._playing = None
+        await self.play_next()
+
+    def stop_playing(self) -> None:
+        if self._playing:
+            self._playing.cancel()
+            self._playing = None
+
+    def state(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "guild_id": self.guild_id,
+            "channel_id": self.channel_id,
+            "state": "paused" if self.paused else
+            ("playing" if self.current else "stopped"),
+            "current": self.as_current(),
+            "duration": self.current["duration"] if self.current else None,
+            "position": 0.0 if self.current else None,
+            "remain": self.current["duration"] if self.current else None,
+            "remainQueue": len(self.queue),
+            "options": self.options,
+            "context": self.context,
+        }
+
+
+class FakeNode:
+    def __init__(self,
+                 host: str = "127.0.0.1",
+                 port: int = 0,
+                 password: Optional[str] = None,
+                 resolve_latency: float = 0.05,
+                 resolve_jitter: float = 0.0,
+                 playlist_size: int = 0,
+                 track_time: Optional[float] = None) -> None:
+        self.host = host
+        self.port = port
+        self.password = password or secrets.token_hex()
+        self.resolve_latency = resolve_latency
+        self.resolve_jitter = resolve_jitter
+        self.playlist_size = playlist_size
+        # tracks end by themselves after this many seconds, otherwise only skips change them
+        self.track_time = track_time
+
+        self.voice_clients: dict[str, FakeVoiceClient] = {}
+        self._voice_states: dict[str, dict[str, Any]] = {}
+        self._ws: Optional[web.WebSocketResponse] = None
+        self._runner: Optional[web.AppRunner] = None
+
+        self.app = web.Application()
+        self.app.router.add_get("/ws", self.feed_socket)
+        self.app.router.add_get("/status", self.status)
+        self.app.router.add_get("/getSource", self.get_source)
+        self.app.router.add_get("/searchSources", self.search_sources)
+        self.app.router.add_get("/context", self.get_context)
+        self.app.router.add_post("/context", self.set_context)
+        self.app.router.add_post("/putSource", self.put_source)
+        self.app.router.add_post("/loadSource", self.load_source)
+        self.app.router.add_get("/options", self.get_options)
+        self.app.router.add_post("/options", self.set_options)
+        self.app.router.add_post("/seek", self.ok)
+        self.app.router.add_post("/skip", self.skip)
+        self.app.router.add_post("/pause", self.pause)
+        self.app.router.add_post("/resume", self.resume)
+        self.app.router.add_post("/shuffle", self.shuffle)
+        self.app.router.add_get("/current", self.get_current)
+        self.app.router.add_get("/queue", self.get_queue)
+        self.app.router.add_post("/queue/{tag}", self.set_queue_source)
+        self.app.router.add_delete("/queue/{tag}", self.remove_queue_source)
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+
+        if not self.port:
+            self.port = site._server.sockets[0].getsockname()[1]  # type: ignore
+
+    async def stop(self) -> None:
+        for vc in self.voice_clients.values():
+            vc.stop_playing()
+        if self._ws:
+            await self._ws.close()
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def resolve(self, query: str) -> None:
+        await asyncio.sleep(
+            max(
+                0.0, self.resolve_latency +
+                random.uniform(-self.resolve_jitter, self.resolve_jitter)))
+
+    async def send(self, op: str, data: Any) -> None:
+        if self._ws and not self._ws.closed:
+            await self._ws.send_str(json.dumps({"op": op, "d": data}))
+
+    # websocket
+
+    async def feed_socket(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+
+        if request.headers.get("Authorization") != self.password:
+            await ws.send_str(
+                json.dumps({
+                    "op": "FORBIDDEN",
+                    "d": "Password mismatch."
+                }))
+            await ws.close()
+            return ws
+
+        self._ws = ws
+        await self.send("HELLO", {
+            "version": "fake",
+            "heartbeat_interval": 15.0
+        })
+
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                continue
+            payload = json.loads(message.data)
+            asyncio.get_event_loop().create_task(
+                self.handle(payload["op"], payload.get("d")))
+
+        return ws
+
+    async def handle(self, op: str, data: Any) -> None:
+        if op == "HEARTBEAT":
+            await self.send("HEARTBEAT_ACK", data)
+        elif op == "IDENTIFY":
+            await self.send("IDENTIFIED", "ClientManager initialized.")
+        elif op == "GET_STATUS":
+            await self.send("STATUS", self.node_status())
+        elif op == "DISCORD_EVENT":
+            await self.discord_event(data)
+        elif op == "getState" and data["guild_id"] in self.voice_clients:
+            await self.send("getState",
+                            self.voice_clients[data["guild_id"]].state())
+        elif op == "getQueue" and data["guild_id"] in self.voice_clients:
+            await self.send(
+                "getQueue", {
+                    "guild_id": data["guild_id"],
+                    "entries": self.voice_clients[data["guild_id"]].queue,
+                })
+        elif op == "VC_DESTROY":
+            await self.destroy(data["guild_id"])
+
+    async def discord_event(self, payload: dict[str, Any]) -> None:
+        data = payload["d"]
+        guild_id = str(data.get("guild_id"))
+
+        if payload["t"] == "VOICE_STATE_UPDATE":
+            if not data.get("channel_id"):
+                await self.destroy(guild_id)
+                return
+            self._voice_states[guild_id] = data
+            if guild_id in self.voice_clients:
+                vc = self.voice_clients[guild_id]
+                vc.channel_id = data["channel_id"]
+                await self.send("VC_CHANNEL_EDITED", {
+                    "guild_id": guild_id,
+                    "channel_id": vc.channel_id
+                })
+        elif payload["t"] == "VOICE_SERVER_UPDATE":
+            state = self._voice_states.get(guild_id)
+            if not state or guild_id in self.voice_clients:
+                return
+            vc = FakeVoiceClient(self, guild_id, state["channel_id"])
+            self.voice_clients[guild_id] = vc
+            await self.send("VC_CREATED", {"guild_id": guild_id, "id": vc.id})
+            await self.send("VC_CHANNEL_EDITED", {
+                "guild_id": guild_id,
+                "channel_id": vc.channel_id
+            })
+
+    async def destroy(self, guild_id: str) -> None:
+        self._voice_states.pop(guild_id, None)
+        vc = self.voice_clients.pop(guild_id, None)
+        if vc:
+            vc.stop_playing()
+            await self.send("VC_DESTROYED", {"guild_id": guild_id})
+
+    def node_status(self) -> dict[str, Any]:
+        return {
+            "Fake": True,
+            "TotalVoiceClients": len(self.voice_clients),
+        }
+
+    # restful
+
+    def voice_client(self, request: web.Request) -> FakeVoiceClient:
+        if request.headers.get("Authorization") != self.password:
+            raise web.HTTPForbidden()
+
+        vc = self.voice_clients.get(request.headers.get("Guild-ID", ""))
+        if not vc or vc.id != request.headers.get("VoiceClient-ID"):
+            raise web.HTTPNotFound()
+        return vc
+
+    async def ok(self, request: web.Request) -> web.Response:
+        self.voice_client(request)
+        return web.json_response({})
+
+    async def status(self, request: web.Request) -> web.Response:
+        return web.json_response(self.node_status())
+
+    async def get_source(self, request: web.Request) -> web.Response:
+        self.voice_client(request)
+        await self.resolve(request.query["query"])
+        return web.json_response(
+            {"source": make_source(request.query["query"])})
+
+    async def search_sources(self, request: web.Request) -> web.Response:
+        self.voice_client(request)
+        await self.resolve(request.query["query"])
+        return web.json_response({
+            "sources": [
+                make_source(f"{request.query['query']}#{index}")
+                for index in range(10)
+            ]
+        })
+
+    async def get_context(self, request: web.Request) -> web.Response:
+        return web.json_response(self.voice_client(request).context)
+
+    async def set_context(self, request: web.Request) -> web.Response:
+        vc = self.voice_client(request)
+        vc.context = (await request.json())["context"]
+        return web.json_response(vc.context)
+
+    async def put_source(self, request: web.Request) -> web.Response:
+        vc = self.voice_client(request)
+        source = (await request.json())["source"]
+        sources = source if isinstance(source, list) else [source]
+        for item in sources:
+            # the node keeps the tag the client sends
+            item["_type"] = "AudioData"
+            item.setdefault("tag", str(uuid.uuid4()))
+        await vc.put(sources)
+        return web.json_response({"source": source})
+
+    async def load_source(self, request: web.Request) -> web.Response:
+        vc = self.voice_client(request)
+        query = (await request.json())["query"]
+        await self.resolve(query)
+
+        if self.playlist_size:
+            sources = [
+                make_source(f"{query}#{index}", extracted=False)
+                for index in range(self.playlist_size)
+            ]
+            await vc.put(sources)
+            return web.json_response({"source": sources})
+
+        source = make_source(query)
+        await vc.put([source])
+        return web.json_response({"source": source})
+
+    async def get_options(self, request: web.Request) -> web.Response:
+        return web.json_response(self.voice_client(request).options)
+
+    async def set_options(self, request: web.Request) -> web.Response:
+        vc = self.voice_client(request)
+        vc.options.update(await request.json())
+        return web.json_response(vc.options)
+
+    async def skip(self, request: web.Request) -> web.Response:
+        vc = self.voice_client(request)
+        await vc.play_next((await request.json()).get("offset", 1))
+        return web.json_response({"remain": len(vc.queue)})
+
+    async def pause(self, request: web.Request) -> web.Response:
+        self.voice_client(request).paused = True
+        return web.json_response({})
+
+    async def resume(self, request: web.Request) -> web.Response:
+        self.voice_client(request).paused = False
+        return web.json_response({})
+
+    async def shuffle(self, request: web.Request) -> web.Response:
+        vc = self.voice_client(request)
+        random.shuffle(vc.queue)
+        return web.json_response({"entries": vc.queue})
+
+    async def get_current(self, request: web.Request) -> web.Response:
+        return web.json_response(self.voice_client(request).as_current())
+
+    async def get_queue(self, request: web.Request) -> web.Response:
+        return web.json_response({"entries": self.voice_client(request).queue})
+
+    async def set_queue_source(self, request: web.Request) -> web.Response:
+        vc = self.voice_client(request)
+        data = await request.json()
+        for index, source in enumerate(vc.queue):
+            if source["tag"] != request.match_info["tag"]:
+                continue
+            if "index" in data:
+                # like the real node, which pops the entry and inserts it where it was
+                del vc.queue[index]
+                await vc.queue_event("delItem", index)
+                vc.queue.insert(index, source)
+                await vc.queue_event("insert", index, source)
+            if "context" in data:
+                source["context"] = data["context"]
+            return web.json_response(source)
+        # the real node answers a missing tag with an IndexError
+        raise web.HTTPInternalServerError()
+
+    async def remove_queue_source(self, request: web.Request) -> web.Response:
+        vc = self.voice_client(request)
+        for index, source in enumerate(vc.queue):
+            if source["tag"] == request.match_info["tag"]:
+                del vc.queue[index]
+                await vc.queue_event("delItem", index)
+                return web.json_response({
+                    "removed": source,
+                    "entries": vc.queue
+                })
+        raise web.HTTPInternalServerError()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--config-json", default="{}")
+    config = json.loads(parser.parse_args().config_json)
+
+    node = FakeNode(host=config.get("HOST", "127.0.0.1"),
+                    port=config.get("PORT", 8000),
+                    password=config.get("PASSWORD"))
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(node.start())
+    try:
+        loop.run_forever()
+    finally:
+        loop.run_until_complete(node.stop())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+Local load test of DicoClient and the Music addon against a fake discodo node and gateway.
+
+    python -m benchmarks.loadtest --guilds 2000 --resolve-latency 0.05 --output result.json
+    python -m benchmarks.loadtest --guilds 2000 --baseline result.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+import psutil
+
+from benchmarks.fake_gateway import FakeBot, FakeGateway, SyntheticGuild
+from benchmarks.fake_node import FakeNode
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.samples: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    async def measure(self, name: str,
+                      func: Callable[[], Awaitable[Any]]) -> None:
+        start = time.perf_counter()
+        try:
+            await func()
+        except Exception:  # noqa
+            self.errors[name] = self.errors.get(name, 0) + 1
+            return
+        self.samples.setdefault(name, []).append(time.perf_counter() - start)
+
+    @staticmethod
+    def percentile(values: list[float], percent: float) -> float:
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1,
+                           int(round(percent / 100 * (len(ordered) - 1))))]
+
+    def summary(self) -> dict[str, dict[str, Optional[float]]]:
+        summary: dict[str, dict[str, Optional[float]]] = {}
+        # commands which only failed are reported too, without latencies
+        for name in sorted(self.samples.keys() | self.errors.keys()):
+            values = self.samples.get(name, [])
+            summary[name] = {
+                "count": len(values),
+                "errors": self.errors.get(name, 0),
+                "p50_ms": self.percentile(values, 50) * 1000 if values else None,
+                "p99_ms": self.percentile(values, 99) * 1000 if values else None,
+                "mean_ms": statistics.fmean(values) * 1000 if values else None,
+            }
+        return summary
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.05) -> None:
+        self.interval = interval
+        self.lags: list[float] = []
+        self._task: Optional[asyncio.Task] = None  # type: ignore
+
+    async def _run(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self) -> None:
+        self._task = asyncio.get_event_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+
+    def summary(self) -> dict[str, float]:
+        if not self.lags:
+            return {}
+        return {
+            "p50_ms": Recorder.percentile(self.lags, 50) * 1000,
+            "p99_ms": Recorder.percentile(self.lags, 99) * 1000,
+            "max_ms": max(self.lags) * 1000,
+        }
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    # the bot modules need the real dependencies, import them only when running
+    import dico_interaction as dico_inter
+
+    import utils
+    from addons.music import Music
+
+    class MeasuredInteractionClient(dico_inter.InteractionClient):
+        # the client handles interactions in tasks of their own, the outcome goes to the context
+        async def handle_interaction(self, target: Any, interaction: Any) -> None:
+            await super().handle_interaction(target, interaction)
+            if not interaction.handled.done():
+                interaction.handled.set_result(None)
+
+        async def execute_error_handler(self, target: Any, interaction: Any,
+                                        ex: Exception) -> None:
+            interaction.handled.set_exception(ex)
+
+    random.seed(args.seed)
+    loop = asyncio.get_event_loop()
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+
+    nodes = [
+        FakeNode(resolve_latency=args.resolve_latency,
+                 resolve_jitter=args.resolve_jitter)
+        for _ in range(args.nodes)
+    ]
+    for node in nodes:
+        await node.start()
+
+    bot = FakeBot(loop, voice_latency=args.voice_latency)
+    bot.audio = utils.discodo.DicoClient(bot)  # type: ignore[attr-defined]
+    bot.settings = utils.settings.GuildSettingsStore(  # type: ignore[attr-defined]
+        utils.cache.CacheClient(backend="memory"))
+    bot.completions = utils.autocomplete.CompletionIndex()  # type: ignore[attr-defined]
+    bot.interaction = MeasuredInteractionClient(loop=loop)  # type: ignore[attr-defined]
+    bot.prefetcher = utils.prefetch.QueuePrefetcher(bot.audio)  # type: ignore[attr-defined]
+    bot.audio.dispatcher.on("SOURCE_START", bot.prefetcher.on_source_start)
+    bot.audio.dispatcher.on("SOURCE_STOP", bot.prefetcher.on_source_stop)
+    bot.audio.dispatcher.on("QUEUE_EVENT", bot.prefetcher.on_queue_event)
+    gateway = FakeGateway(bot, args.guilds)
+
+    await asyncio.wait([
+        bot.audio.register_node(  # type: ignore[attr-defined]
+            host=node.host, port=node.port, password=node.password)
+        for node in nodes
+    ] + [loop.create_task(gateway.ready())])
+
+    music = Music(bot)
+    music.on_load()
+    # registered like dico_command.Bot.load_addons does, the commands are dispatched by name
+    for command in vars(Music).values():
+        if isinstance(command, dico_inter.InteractionCommand):
+            command.register_self_or_cls(music)
+            bot.interaction.add_command(command)  # type: ignore[attr-defined]
+
+    recorder = Recorder()
+    lag = LoopLagMonitor()
+    lag.start()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited(name: str, func: Callable[[],
+                                                 Awaitable[Any]]) -> None:
+        async with semaphore:
+            await recorder.measure(name, func)
+
+    def connect(guild: SyntheticGuild) -> Callable[[], Awaitable[Any]]:
+        return lambda: bot.audio.connect(  # type: ignore[attr-defined]
+            guild.id, guild.voice_channel_id)
+
+    async def invoke(guild: SyntheticGuild, name: str, **options: Any) -> None:
+        # through the interaction client like a gateway interaction, checks and options included
+        payload = gateway.interaction(guild, name, **options)
+        payload["logger"] = bot.interaction.logger  # type: ignore[attr-defined]
+        ctx = dico_inter.InteractionContext.create(bot, payload)
+        if not bot.interaction.get_command(ctx):  # type: ignore[attr-defined]
+            raise LookupError(name)
+        ctx.handled = loop.create_future()
+        await bot.interaction.receive(ctx)  # type: ignore[attr-defined]
+        await ctx.handled
+
+    def play(guild: SyntheticGuild) -> Callable[[], Awaitable[Any]]:
+        return lambda: invoke(guild, "play", query=f"query {random.random()}")
+
+    def skip(guild: SyntheticGuild) -> Callable[[], Awaitable[Any]]:
+        return lambda: invoke(guild, "skip", offset=1)
+
+    def queue(guild: SyntheticGuild) -> Callable[[], Awaitable[Any]]:
+        return lambda: invoke(guild, "queue")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(limited("connect", connect(guild))
+                           for guild in gateway.guilds))
+    for _ in range(args.rounds):
+        await asyncio.gather(*(limited("play", play(guild))
+                               for guild in gateway.guilds))
+        await asyncio.gather(*(limited("queue", queue(guild))
+                               for guild in gateway.guilds))
+    await asyncio.gather(*(limited("skip", skip(guild))
+                           for guild in gateway.guilds))
+    elapsed = time.perf_counter() - started
+
+    lag.stop()
+    music.on_unload()
+    bot.prefetcher.stop()  # type: ignore[attr-defined]
+    for node in nodes:
+        await node.stop()
+
+    return {
+        "config": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("output", "baseline", "tolerance")
+        },
+        "elapsed_s": elapsed,
+        "commands": recorder.summary(),
+        "loop_lag": lag.summary(),
+        "memory": {
+            "rss_mb": process.memory_info().rss / 1024 / 1024,
+            "rss_delta_mb": (process.memory_info().rss - rss_before) / 1024 /
+            1024,
+        },
+        "messages_sent": bot.sent_messages,
+    }
+
+
+def compare(result: dict[str, Any], baseline: dict[str, Any],
+            tolerance: float) -> list[str]:
+    regressions: list[str] = []
+    for name, stats in result["commands"].items():
+        before = baseline.get("commands", {}).get(name)
+        if not before:
+            regressions.append(f"{name}: not in the baseline")
+            continue
+        if stats["errors"] > before.get("errors", 0):
+            regressions.append(
+                f"{name} errors: {before.get('errors', 0)} -> {stats['errors']}")
+        for key in ("p50_ms", "p99_ms"):
+            if stats[key] is None or before.get(key) is None:
+                continue
+            if stats[key] > before[key] * (1 + tolerance):
+                regressions.append(
+                    f"{name} {key}: {before[key]:.2f} -> {stats[key]:.2f}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--guilds", type=int, default=1000)
+    parser.add_argument("--nodes", type=int, default=1)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--resolve-latency", type=float, default=0.05)
+    parser.add_argument("--resolve-jitter", type=float, default=0.0)
+    parser.add_argument("--voice-latency", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--loop", choices=("asyncio", "uvloop"),
+                        default="asyncio")
+    parser.add_argument("--output", help="write the result as json")
+    parser.add_argument("--baseline",
+                        help="fail when p50/p99 or errors regress from this result")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.loop == "uvloop":
+        import uvloop
+        uvloop.install()
+
+    result = asyncio.get_event_loop().run_until_complete(run(args))
+    print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(result, fp, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as fp:
+            regressions = compare(result, json.load(fp), args.tolerance)
+        if regressions:
+            print("regressions:\n" + "\n".join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
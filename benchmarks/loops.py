@@ -0,0 +1,58 @@
+"""
+Runs the load test once on the default asyncio loop and once on uvloop, and compares them.
+Each run is a separate process, extra arguments are passed to benchmarks.loadtest.
+
+    python -m benchmarks.loops --guilds 2000 --resolve-latency 0.05
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Any
+
+LOOPS = ("asyncio", "uvloop")
+
+
+def run(loop: str, args: list[str]) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "result.json")
+        subprocess.run(
+            [
+                sys.executable, "-m", "benchmarks.loadtest", "--loop", loop,
+                "--output", output, *args
+            ],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        with open(output) as fp:
+            return json.load(fp)  # type: ignore[no-any-return]
+
+
+def main() -> None:
+    results = {loop: run(loop, sys.argv[1:]) for loop in LOOPS}
+
+    rows = [("", *LOOPS)]
+    for name in results[LOOPS[0]]["commands"]:
+        for key in ("p50_ms", "p99_ms"):
+            rows.append((f"{name} {key}", *(
+                f"{result['commands'].get(name, {}).get(key, 0):.2f}"
+                for result in results.values())))
+    for key in ("p50_ms", "p99_ms", "max_ms"):
+        rows.append((f"loop lag {key}", *(
+            f"{result['loop_lag'].get(key, 0):.2f}"
+            for result in results.values())))
+    rows.append(("elapsed_s", *(f"{result['elapsed_s']:.2f}"
+                                for result in results.values())))
+    rows.append(("rss_mb", *(f"{result['memory']['rss_mb']:.1f}"
+                             for result in results.values())))
+
+    widths = [
+        max(len(row[index]) for row in rows) for index in range(len(rows[0]))
+    ]
+    for row in rows:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Replays a capture of gateway payloads and node events into an offline bot against a fake discodo node.
+Captures are written by the bot with the "capture" config, pass the rotated files oldest first.
+
+    python -m benchmarks.replay captures/events.jsonl.gz.1 captures/events.jsonl.gz --speed 10
+    python -m benchmarks.replay captures/events.jsonl.gz --speed 0 --profile replay.prof
+    py-spy record -o replay.svg -- python -m benchmarks.replay captures/events.jsonl.gz --speed 0
+"""
+import argparse
+import asyncio
+import cProfile
+import json
+import pstats
+import sys
+import time
+import types
+from typing import Any
+
+from benchmarks.fake_gateway import FakeBot
+from benchmarks.fake_node import FakeNode
+from benchmarks.loadtest import LoopLagMonitor, Recorder
+
+
+def voice_state(data: dict[str, Any]) -> types.SimpleNamespace:
+    # only the fields the handler reads, without building dico models
+    return types.SimpleNamespace(
+        guild_id=int(data["guild_id"]) if data.get("guild_id") else None,
+        user_id=int(data["user_id"]),
+        channel_id=int(data["channel_id"]) if data.get("channel_id") else None,
+    )
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    # the bot modules need the real dependencies, import them only when running
+    import dico_interaction as dico_inter
+
+    import utils
+    from addons.music import Music
+    from models import ChorokBot
+
+    records = list(utils.capture.read(args.paths))
+    header = next(
+        (record for record in records if record["kind"] == "header"), None)
+    if header is None:
+        raise SystemExit(
+            "the capture has no header, the bot wasn't ready while capturing")
+    records = sorted(
+        (record for record in records if record["kind"] != "header"),
+        key=lambda record: record["at"])
+    if args.limit:
+        records = records[:args.limit]
+
+    loop = asyncio.get_event_loop()
+    node = FakeNode(resolve_latency=args.resolve_latency)
+    await node.start()
+
+    # wired like ChorokBot, with the in-process cache
+    bot = FakeBot(loop)
+    bot.application_id = int(header["data"]["application_id"])
+    cache = utils.cache.CacheClient(backend="memory")
+    bot.audio = audio = utils.discodo.DicoClient(bot)  # type: ignore[attr-defined]
+    bot.settings = utils.settings.GuildSettingsStore(cache)  # type: ignore[attr-defined]
+    bot.history = utils.history.PlayHistory(cache)  # type: ignore[attr-defined]
+    bot.completions = utils.autocomplete.CompletionIndex()  # type: ignore[attr-defined]
+    bot.prefetcher = utils.prefetch.QueuePrefetcher(audio)  # type: ignore[attr-defined]
+    bot.interaction = dico_inter.InteractionClient(loop=loop)  # type: ignore[attr-defined]
+    audio.dispatcher.on("SOURCE_START", bot.history.on_source_start)
+    audio.dispatcher.on("SOURCE_STOP", bot.history.on_source_stop)
+    audio.dispatcher.on("SOURCE_START", bot.completions.on_source_start)
+    audio.dispatcher.on("SOURCE_START", bot.prefetcher.on_source_start)
+    audio.dispatcher.on("SOURCE_STOP", bot.prefetcher.on_source_stop)
+    audio.dispatcher.on("QUEUE_EVENT", bot.prefetcher.on_queue_event)
+
+    await audio.register_node(host=node.host,
+                              port=node.port,
+                              password=node.password)
+    bot.set_ready()
+    music = Music(bot)
+    music.on_load()
+
+    async def feed(record: dict[str, Any]) -> None:
+        if record["kind"] == "node":
+            await audio._on_any_node_event(record["event"], record["data"])
+            return
+
+        payload = record["data"]
+        await bot.dispatch("raw", payload)
+        if payload.get("t") == "VOICE_STATE_UPDATE" and payload["d"].get(
+                "guild_id"):
+            await ChorokBot._voice_state_update_handler(
+                bot, voice_state(payload["d"]))
+
+    recorder = Recorder()
+    lag = LoopLagMonitor()
+    lag.start()
+    profiler = cProfile.Profile() if args.profile else None
+    tasks: list[asyncio.Task] = []  # type: ignore[type-arg]
+
+    if profiler:
+        profiler.enable()
+    started = time.perf_counter()
+    first = records[0]["at"] if records else 0.0
+    for record in records:
+        if args.speed:
+            delay = (record["at"] - first) / args.speed - (
+                time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        # the bot handles every event in its own task as well
+        tasks.append(
+            loop.create_task(
+                recorder.measure(f"{record['kind']}.{record['event']}",
+                                 lambda record=record: feed(record))))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+
+    lag.stop()
+    music.on_unload()
+    bot.prefetcher.stop()
+    await node.stop()
+
+    return {
+        "config": {
+            key: value
+            for key, value in vars(args).items() if key != "paths"
+        },
+        "records": len(records),
+        "captured_s": records[-1]["at"] - first if records else 0.0,
+        "elapsed_s": elapsed,
+        "events": recorder.summary(),
+        "loop_lag": lag.summary(),
+        "voice_clients": len(audio.voice_clients),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("paths", nargs="+", help="capture files, oldest first")
+    parser.add_argument("--speed",
+                        type=float,
+                        default=1.0,
+                        help="1: as captured, 10: ten times faster, 0: as fast as possible")
+    parser.add_argument("--limit", type=int, default=0,
+                        help="replay only this many events")
+    parser.add_argument("--resolve-latency", type=float, default=0.05)
+    parser.add_argument("--profile",
+                        help="write cProfile stats of the replay to this file")
+    parser.add_argument("--output", help="write the result as json")
+    args = parser.parse_args()
+
+    result = asyncio.get_event_loop().run_until_complete(run(args))
+    print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(result, fp, indent=2)
+
+    if args.profile:
+        pstats.Stats(args.profile,
+                     stream=sys.stderr).sort_stats("cumulative").print_stats(30)
+
+
+if __name__ == "__main__":
+    main()
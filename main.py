@@ -5,12 +5,23 @@ import dico  # noqa
 import utils
 from models import ChorokBot
 
-config = utils.config.load("config.json", sys.argv[1])
-if not config:
-    raise SystemError("invalid config")
+try:
+    config = utils.config.load("config.json", sys.argv[1])
+except utils.config.ConfigError as exc:
+    raise SystemError(f"invalid config: {exc}") from exc
+
+if config.get("uvloop", False):
+    # the loop policy has to be set before the bot gets its loop
+    try:
+        import uvloop
+    except ImportError as exc:
+        raise SystemError("'uvloop' is enabled but not installed") from exc
+    uvloop.install()
 
 bot = ChorokBot(
     config=config,
+    config_path="config.json",
+    config_mode=sys.argv[1],
     token=config["token"]["discord"],
     prefix="",
     default_allowed_mentions=dico.AllowedMentions(),
@@ -1,9 +1,11 @@
+import asyncio
 import contextlib
 import enum
 import logging
+import logging.handlers
 import os
-import traceback
-from typing import Any
+import signal
+from typing import Any, Optional
 
 import dico  # noqa
 import dico.utils  # noqa
@@ -16,11 +18,14 @@ from rich.logging import RichHandler
 
 import utils
 
-logging.basicConfig(
-    level=logging.INFO,
-    handlers=[RichHandler(rich_tracebacks=True)],
-    format="%(name)s :\t%(message)s",
-)
+rich_handler = RichHandler(rich_tracebacks=True)
+rich_handler.setFormatter(logging.Formatter("%(name)s :\t%(message)s"))
+log_handler = utils.errors.DroppingQueueHandler()
+logging.basicConfig(level=logging.INFO, handlers=[log_handler])
+log_listener = logging.handlers.QueueListener(log_handler.queue,
+                                              rich_handler,
+                                              respect_handler_level=True)
+log_listener.start()
 
 
 class Colors(enum.IntEnum):
@@ -30,34 +35,307 @@ class Colors(enum.IntEnum):
 
 
 class ChorokBot(Bot):  # type: ignore[call-arg, misc]
-    def __init__(self, config: dict[str, Any], *args: Any,
+    def __init__(self,
+                 config: dict[str, Any],
+                 *args: Any,
+                 config_path: Optional[str] = None,
+                 config_mode: Optional[str] = None,
                  **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
         dico_inter.InteractionClient(client=self, auto_register_commands=True)
 
         self.config: dict[str, Any] = config
+        self.config_path = config_path
+        self.config_mode = config_mode
         self.bot_logger = logging.getLogger("bot")
+        self.errors = utils.errors.ErrorAggregator()
+        self.loop.create_task(self.errors.run())
+        self.log_handler = log_handler
+        self.loop.create_task(self.log_handler.run())
+        utils.tracing.tracer.configure(self.loop, **config.get("tracing", {}))
+        self.watchdog = utils.watchdog.LoopWatchdog(
+            self.loop, **config.get("watchdog", {}))
+        self.watchdog.start()
         self.audio = utils.discodo.DicoClient(self)
+        capture = dict(config.get("capture", {}))
+        if capture.pop("enabled", False):
+            self.audio.recorder = utils.capture.EventRecorder(
+                application_id=lambda: self.application_id, **capture)
+            self.loop.create_task(self.audio.recorder.run())
         self.koreanbots = utils.koreanbots.KoreanbotsClient(
             self, k_token := config["token"]["koreanbots"], bool(k_token))
         self.redis_cache = utils.cache.CacheClient(**config["cache"])
+        self.settings = utils.settings.GuildSettingsStore(self.redis_cache)
+        self.loop.create_task(self.settings.run())
+        self.history = utils.history.PlayHistory(self.redis_cache)
+        self.loop.create_task(self.history.run())
+        self.audio.dispatcher.on("SOURCE_START",
+                                 self.history.on_source_start)
+        self.audio.dispatcher.on("SOURCE_STOP", self.history.on_source_stop)
+        self.completions = utils.autocomplete.CompletionIndex(
+            **config.get("autocomplete", {}))
+        self.audio.dispatcher.on("SOURCE_START",
+                                 self.completions.on_source_start)
+        self.prefetcher = utils.prefetch.QueuePrefetcher(
+            self.audio, **config.get("prefetch", {}))
+        self.audio.dispatcher.on("SOURCE_START",
+                                 self.prefetcher.on_source_start)
+        self.audio.dispatcher.on("SOURCE_STOP", self.prefetcher.on_source_stop)
+        self.audio.dispatcher.on("QUEUE_EVENT", self.prefetcher.on_queue_event)
+        self.audio.dispatcher.on("VC_DESTROYED",
+                                 self.prefetcher.on_vc_destroyed)
+        self.sessions = utils.gateway.SessionStore(self.redis_cache)
+        self.gateway_state = utils.gateway.GatewayState()
+        self.shard_manager = utils.gateway.ShardManager(
+            self, self.presence, **config.get("shards", {}))
+        self.loop.create_task(self.shard_manager.run())
+        self.ready_shards: set[int] = set()
+        self._all_ready = asyncio.Event()
+        self._shutting_down = False
 
+        self.node_tasks: dict[str, asyncio.Task] = {}  # type: ignore
         for node_conf in self.config["node"]:
-            if node_conf.get("local", False) or not any(
-                (node_conf.get(key, None)
-                 for key in ("host", "port", "password"))):
-                self.audio.register_node()
-                break
-            self.audio.register_node(
+            self.register_node(node_conf)
+
+        self.autoscaler: Optional[utils.autoscaler.NodeAutoscaler] = None
+        autoscale = dict(config.get("autoscale", {}))
+        if autoscale.pop("enabled", False):
+            self.autoscaler = utils.autoscaler.NodeAutoscaler(
+                self.audio, **autoscale)
+            self.loop.create_task(self.autoscaler.run())
+
+        self.interaction_server: Optional[
+            utils.interactions.InteractionServer] = None
+        interactions = dict(config.get("interactions", {}))
+        if interactions.pop("enabled", False):
+            self.interaction_server = utils.interactions.InteractionServer(
+                self, **interactions)
+            self.loop.create_task(self.interaction_server.start())
+
+        # /reload and the config watcher can reload at the same time
+        self._reload_lock = asyncio.Lock()
+        if config_path and config_mode and config.get("watch_config", False):
+            self.loop.create_task(
+                utils.config.ConfigWatcher(config_path, config_mode,
+                                           self.reload_config).watch())
+
+        self.on_("ready", self._ready_handler)
+        self.on_("shard_resumed", self._shard_resumed_handler)
+        self.on_("voice_state_update", self._voice_state_update_handler)
+        self.on_("interaction_error", self._interaction_error_handler)
+
+        with contextlib.suppress(NotImplementedError):
+            self.loop.add_signal_handler(
+                signal.SIGTERM, lambda: self.loop.create_task(self.shutdown()))
+
+    @property
+    def guild_count(self) -> int:
+        # resumed shards don't receive READY and GUILD_CREATE again
+        return max(super().guild_count or 0,
+                   len(self.gateway_state.guild_ids))
+
+    async def wait_ready(self) -> None:
+        await self._all_ready.wait()
+
+    async def start(self,
+                    reconnect_on_unknown_disconnect: bool = False,
+                    compress: bool = False) -> None:
+        # commands work as soon as the first shard is ready, not after the last one
+        self.load_modules()
+
+        if not self.monoshard:
+            return await super().start(reconnect_on_unknown_disconnect,
+                                       compress)
+
+        gateway = await self.request_gateway()
+        if self.shard_count is None:
+            self.shard_count = gateway.shards
+        if self.user is None:
+            self.user = await self.request_user()
+
+        try:
+            snapshot = await self.sessions.load(self.shard_count)
+        except Exception as exc:  # noqa
+            self.bot_logger.warning(f"cannot load gateway sessions: {exc!r}")
+            snapshot = None
+        sessions = snapshot["sessions"] if snapshot else {}
+        if snapshot:
+            self.warm(snapshot["state"])
+
+        # same as dico's own start except for resuming, its shards are private
+        self._Client__shard_ids = [*range(self.shard_count)]
+        ws_class = utils.gateway.ResumableWebSocketClient
+        for shard_id in range(self.shard_count):
+            ws = await ws_class.connect_without_request(
+                gateway,
+                self.http,
+                self.intents,
+                self.events,
+                reconnect_on_unknown_disconnect,
+                compress,
+                shard=[shard_id, self.shard_count],
+            )
+            ws.state = self.gateway_state
+            self.shard_manager.track(ws)
+            if session := sessions.get(str(shard_id)):
+                ws.restore(session)
+            self._Client__shards[shard_id] = ws
+            await ws.receive_once()
+            self.loop.create_task(ws.run())
+            if not session:
+                # only IDENTIFY is rate limited
+                await asyncio.sleep(5)
+
+    def warm(self, state: dict[str, Any]) -> None:
+        self.gateway_state.load(state)
+        if state["application_id"]:
+            self.application_id = dico.Snowflake(state["application_id"])
+        for voice_state in state["voice_states"]:
+            self.events.dispatch_from_raw("VOICE_STATE_UPDATE", voice_state)
+
+        self.bot_logger.info(
+            f"warmed {len(self.gateway_state.guild_ids)} guilds and "
+            f"{len(self.gateway_state.voice_states)} voice states from the last session"
+        )
+
+    async def shutdown(self) -> None:
+        if self._shutting_down:
+            return
+        self._shutting_down = True
+        self.bot_logger.info("shutting down")
+
+        shards = self.shards or ()
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(shard.suspend() for shard in shards)), 5)
+            await asyncio.wait_for(
+                self.sessions.save(self.shard_count, shards,
+                                   self.gateway_state), 5)
+        except Exception as exc:  # noqa
+            self.bot_logger.warning(f"cannot save gateway sessions: {exc!r}")
+
+        try:
+            await asyncio.wait_for(self.settings.flush(), 5)
+        except Exception as exc:  # noqa
+            self.bot_logger.warning(f"cannot save guild settings: {exc!r}")
+
+        try:
+            await asyncio.wait_for(self.history.flush(), 5)
+        except Exception as exc:  # noqa
+            self.bot_logger.warning(f"cannot save play history: {exc!r}")
+
+        if self.interaction_server:
+            with contextlib.suppress(Exception):
+                await asyncio.wait_for(self.interaction_server.close(), 5)
+
+        if self.audio.recorder:
+            try:
+                await asyncio.wait_for(self.audio.recorder.flush(), 5)
+            except Exception as exc:  # noqa
+                self.bot_logger.warning(f"cannot save the capture: {exc!r}")
+
+        self.prefetcher.stop()
+        if self.autoscaler:
+            self.autoscaler.stop()
+
+        self.loop.stop()
+        # the listener thread writes out the queued records before it stops
+        self.log_handler.report()
+        with contextlib.suppress(Exception):
+            log_listener.stop()
+
+    def register_node(self, node_conf: dict[str, Any]) -> None:
+        key = utils.config.node_key(node_conf)
+        if key in self.node_tasks:
+            return
+
+        options = {
+            "region": node_conf.get("region"),
+            "max_heavy_requests": node_conf.get("max_heavy_requests", 4),
+            "max_voice_clients": node_conf.get("max_voice_clients"),
+        }
+        if key == "local":
+            self.node_tasks[key] = self.audio.register_node(**options)
+        else:
+            self.node_tasks[key] = self.audio.register_node(
                 host=node_conf["host"],
                 port=node_conf["port"],
                 password=node_conf["password"],
+                **options,
             )
 
-        self.on_("ready", self._ready_handler)
-        self.on_("shards_ready", self._shards_ready_handler)
-        self.on_("voice_state_update", self._voice_state_update_handler)
-        self.on_("interaction_error", self._interaction_error_handler)
+    async def unregister_node(self, key: str) -> None:
+        task = self.node_tasks.pop(key)
+        if not task.done():
+            task.cancel()
+            return
+
+        if not task.cancelled() and not task.exception():
+            await self.audio.remove_node(task.result())
+
+    def reconfigure_node(self, key: str, node_conf: dict[str, Any]) -> bool:
+        task = self.node_tasks[key]
+        if not task.done() or task.cancelled() or task.exception():
+            return False
+
+        # placement options are read on every placement, the rest needs a new node client
+        before = next(conf for conf in self.config["node"]
+                      if utils.config.node_key(conf) == key)
+        changed = {
+            field
+            for field in before.keys() | node_conf.keys()
+            if before.get(field) != node_conf.get(field)
+        }
+        if not changed <= {"region", "max_voice_clients"}:
+            return False
+
+        node = task.result()
+        node.region = node_conf.get("region")
+        node.max_voice_clients = node_conf.get("max_voice_clients")
+        return True
+
+    async def reload_config(self, config: dict[str, Any]) -> None:
+        async with self._reload_lock:
+            utils.config.validate(config)
+
+            keys = {
+                utils.config.node_key(node_conf): node_conf
+                for node_conf in config["node"]
+            }
+            previous = {
+                utils.config.node_key(node_conf): node_conf
+                for node_conf in self.config["node"]
+            }
+            added = [key for key in keys if key not in self.node_tasks]
+            removed = [key for key in self.node_tasks if key not in keys]
+            changed = [
+                key for key in keys
+                if key in self.node_tasks and keys[key] != previous.get(key)
+            ]
+            # nodes which can't be changed in place are drained and connected again
+            reconnected = [
+                key for key in changed
+                if not self.reconfigure_node(key, keys[key])
+            ]
+
+            await asyncio.gather(*(self.unregister_node(key)
+                                   for key in removed + reconnected))
+            for key in added + reconnected:
+                self.register_node(keys[key])
+
+            if config["cache"] != self.config["cache"]:
+                previous_cache = self.redis_cache
+                self.redis_cache = utils.cache.CacheClient(**config["cache"])
+                self.settings.cache = self.redis_cache
+                self.sessions.cache = self.redis_cache
+                self.history.cache = self.redis_cache
+                with contextlib.suppress(Exception):
+                    await previous_cache.close()
+
+            self.config = config
+            self.bot_logger.info(
+                f"reloaded config, added nodes {added}, removed nodes {removed} and changed nodes {changed}"
+            )
 
     def load_modules(self) -> None:
         for filename in os.listdir("addons"):
@@ -74,22 +352,39 @@ class ChorokBot(Bot):  # type: ignore[call-arg, misc]
                         f"skipping invalid module 'addons/{filename}'")
                     continue
 
+    def presence(self, shard_id: int) -> dict[str, Any]:
+        return {
+            "activities": [
+                dico.Activity(activity_type=dico.ActivityTypes.LISTENING,
+                              name=f"/help, {shard_id + 1}호기").to_dict()
+            ],
+            "since": None,
+            "status": "online",
+            "afk": False,
+        }
+
     async def _shards_ready_handler(self) -> None:
-        user = await self.request_user()
         self.bot_logger.info(
-            f"logged in as '{user}' and can see {self.guild_count} guilds and {self.shard_count} shards"
+            f"logged in as '{self.user}' and can see {self.guild_count} guilds and {self.shard_count} shards"
         )
-        self.load_modules()
+
+    def _shard_ready(self, shard_id: int) -> None:
+        self.ready_shards.add(shard_id)
+        if len(self.ready_shards) != self.shard_count:
+            return
+        if not self._all_ready.is_set():
+            self._all_ready.set()
+            self.loop.create_task(self._shards_ready_handler())
+
+    async def _shard_resumed_handler(self, shard_id: int) -> None:
+        self.bot_logger.info(f"shard {shard_id} is resumed")
+        self.shard_manager.on_ready(shard_id, resumed=True)
+        self._shard_ready(shard_id)
 
     async def _ready_handler(self, ready: dico.Ready) -> None:
         self.bot_logger.info(f"shard {ready.shard_id} is ready")
-        await self.shards[ready.shard_id].update_presence(activities=[
-            dico.Activity(activity_type=dico.ActivityTypes.LISTENING,
-                          name=f"/help, {ready.shard_id + 1}호기").to_dict()
-        ],
-            since=None,
-            status="online",
-            afk=False)
+        self.shard_manager.on_ready(ready.shard_id)
+        self._shard_ready(ready.shard_id)
 
     async def _interaction_error_handler(  # noqa
             self, ctx: dico_inter.InteractionContext,
@@ -97,18 +392,27 @@ class ChorokBot(Bot):  # type: ignore[call-arg, misc]
         if isinstance(error, CheckFailed):
             return
 
-        tb: str = "".join(
-            traceback.format_exception(type(error), error,
-                                       error.__traceback__))
+        key, record = self.errors.record(error)
+        if record.count > 1:
+            # already reported in this window, it is counted into the summary
+            with contextlib.suppress(Exception):
+                await ctx.send(embed=dico.Embed(
+                    description="알 수 없는 오류가 발생했습니다.\n"
+                    f"잠시 후 다시 시도해 주시기 바랍니다. (오류 코드: `{key}`)",
+                    color=Colors.error))
+            return
+
+        tb = self.errors.render(record, error)
         tb = ("..." + tb[-1997:]) if len(tb) > 2000 else tb
         with contextlib.suppress(Exception):
             await ctx.send(embed=dico.Embed(
                 description="알 수 없는 오류가 발생했습니다.\n"
                 "오류가 계속 발생할 경우 [서포트 서버](https://discord.gg/P25nShtqFX)의 버그 채널에 문의하시기 바랍니다.\n"
+                f"오류 코드: `{key}`\n"
                 "```py\n" + tb + "\n```",
                 color=Colors.error))
         self.bot_logger.error(
-            f"an error occurred while handling '{ctx.data.name}'",
+            f"an error occurred while handling '{ctx.data.name}' ({key})",
             exc_info=(type(error), error, error.__traceback__))
 
     async def _voice_state_update_handler(self, vs: dico.VoiceState) -> None:
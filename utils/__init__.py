@@ -1 +1,4 @@
-from . import cache, config, discodo, formatter, koreanbots
+from . import (autocomplete, autoscaler, cache, capture, config, discodo,
+               errors, formatter, gateway, history, interactions, koreanbots,
+               nowplaying, prefetch, queue_ops, regions, settings, sources,
+               tracing, watchdog)
@@ -0,0 +1,167 @@
+import bisect
+import collections
+import itertools
+import re
+from typing import Any, Iterable, Optional
+
+import discodo  # noqa
+
+# Discord limits the name and the value of a choice to 100 characters
+MAX_CHOICE_LENGTH = 100
+MAX_CHOICES = 25
+
+_URL = re.compile(r"^https?://", re.IGNORECASE)
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.casefold().split())
+
+
+class Completion:
+    __slots__ = ("label", "value", "keys", "uses")
+
+    def __init__(self, label: str, value: str, keys: list[str]) -> None:
+        self.label = label
+        self.value = value
+        self.keys = keys
+        self.uses = 0
+
+
+class CompletionIndex:
+    """
+    Prefix index of recently played titles and typed queries, per guild and global.
+    Every word of an entry starts a key, so "blue" finds "IU - Blueming" too.
+    Entries are evicted least recently used first over ``max_entries`` in total
+    and ``max_guild_entries`` in a guild.
+    """
+    def __init__(self,
+                 max_entries: int = 20000,
+                 max_guild_entries: int = 500,
+                 max_words: int = 8,
+                 max_scan: int = 500) -> None:
+        self.max_entries = max_entries
+        self.max_guild_entries = max_guild_entries
+        self.max_words = max_words
+        # matches ranked for a short prefix, so it is answered in time however many there are
+        self.max_scan = max_scan
+
+        # (guild id or None, value), least recently used first
+        self._recent: collections.OrderedDict[tuple[Optional[int], str],
+                                              Completion] = collections.OrderedDict()
+        self._scopes: dict[Optional[int],
+                           collections.OrderedDict[str, Completion]] = {}
+        # sorted (key, value) of a scope
+        self._keys: dict[Optional[int], list[tuple[str, str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._recent)
+
+    def keys_of(self, label: str) -> list[str]:
+        words = normalize(label).split(" ")
+        return [
+            " ".join(words[index:])
+            for index in range(min(len(words), self.max_words))
+        ]
+
+    def add(self,
+            guild_id: Optional[int],
+            label: str,
+            value: Optional[str] = None) -> None:
+        label = " ".join(label.split())[:MAX_CHOICE_LENGTH]
+        if not label:
+            return
+        if not value or len(value) > MAX_CHOICE_LENGTH:
+            value = label
+
+        scopes = (None, ) if guild_id is None else (int(guild_id), None)
+        for scope in scopes:
+            self._add(scope, label, value)
+
+    def _add(self, scope: Optional[int], label: str, value: str) -> None:
+        entries = self._scopes.setdefault(scope, collections.OrderedDict())
+        entry = entries.get(value)
+        if entry is None:
+            entry = entries[value] = Completion(label, value,
+                                                self.keys_of(label))
+            keys = self._keys.setdefault(scope, [])
+            for key in entry.keys:
+                bisect.insort(keys, (key, value))
+        entry.uses += 1
+
+        entries.move_to_end(value)
+        self._recent[(scope, value)] = entry
+        self._recent.move_to_end((scope, value))
+
+        if scope is not None and len(entries) > self.max_guild_entries:
+            self._remove(scope, next(iter(entries)))
+        while len(self._recent) > self.max_entries:
+            self._remove(*next(iter(self._recent)))
+
+    def _remove(self, scope: Optional[int], value: str) -> None:
+        entry = self._scopes[scope].pop(value)
+        del self._recent[(scope, value)]
+
+        keys = self._keys[scope]
+        for key in entry.keys:
+            index = bisect.bisect_left(keys, (key, value))
+            if index < len(keys) and keys[index] == (key, value):
+                del keys[index]
+
+        if not self._scopes[scope]:
+            del self._scopes[scope]
+            del self._keys[scope]
+
+    def add_sources(self, guild_id: Optional[int], sources: Any) -> None:
+        for source in (sources if isinstance(sources, list) else [sources
+                                                                   ])[:10]:
+            self.add(guild_id, source.title or "", source.webpage_url)
+
+    def add_query(self, guild_id: Optional[int], query: str) -> None:
+        # links are indexed by the titles they resolve to
+        if not _URL.match(query.strip()):
+            self.add(guild_id, query)
+
+    def _matches(self, scope: Optional[int], prefix: str) -> Iterable[Completion]:
+        entries = self._scopes.get(scope)
+        if not entries:
+            return
+
+        if not prefix:
+            yield from reversed(entries.values())
+            return
+
+        keys = self._keys[scope]
+        seen: set[str] = set()
+        index = bisect.bisect_left(keys, (prefix, ""))
+        while index < len(keys) and keys[index][0].startswith(prefix):
+            value = keys[index][1]
+            if value not in seen:
+                seen.add(value)
+                yield entries[value]
+            index += 1
+
+    def complete(self,
+                 guild_id: Optional[int],
+                 text: str,
+                 limit: int = MAX_CHOICES) -> list[tuple[str, str]]:
+        prefix = normalize(text)
+        choices: dict[str, str] = {}
+        scopes = (None, ) if guild_id is None else (int(guild_id), None)
+        for scope in scopes:
+            # the guild's own entries come first, the most played of them first
+            matches = sorted(itertools.islice(self._matches(scope, prefix),
+                                              self.max_scan),
+                             key=lambda entry: -entry.uses)
+            for entry in matches:
+                choices.setdefault(entry.value, entry.label)
+                if len(choices) >= limit:
+                    break
+            if len(choices) >= limit:
+                break
+        return [(label, value) for value, label in choices.items()]
+
+    async def on_source_start(self, voice: discodo.VoiceClient,
+                              data: dict[str, Any]) -> None:
+        source = data["source"]
+        self.add(int(voice.guild_id),
+                 source.get("title") or "", source.get("webpage_url"))
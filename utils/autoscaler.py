@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Optional
+
+from .discodo import DicoClient, NodeClient
+
+
+class NodeAutoscaler:
+    """
+    Launches local nodes while the nodes are busy and retires them when they are idle again.
+    Scaling needs the load over ``scale_up`` (under ``scale_down``) for ``sustain`` checks in a row
+    and ``cooldown`` seconds after the last change, so it doesn't flap around one threshold.
+    """
+    def __init__(self,
+                 client: DicoClient,
+                 max_cores: Optional[int] = None,
+                 players_per_node: int = 100,
+                 scale_up: float = 0.8,
+                 scale_down: float = 0.3,
+                 sustain: int = 3,
+                 interval: float = 30.0,
+                 cooldown: float = 300.0,
+                 launch_options: Optional[dict[str, Any]] = None) -> None:
+        self.client = client
+        # a node mostly runs on one core, so the core budget is the local node budget
+        self.max_cores = max_cores or os.cpu_count() or 1
+        self.players_per_node = players_per_node
+        self.scale_up = scale_up
+        self.scale_down = scale_down
+        self.sustain = sustain
+        self.interval = interval
+        self.cooldown = cooldown
+        self.launch_options = launch_options or {}
+
+        self.logger = logging.getLogger("autoscaler")
+        self.load = 0.0
+        self._streak = 0
+        self._changed_at = 0.0
+
+    @property
+    def scaled_nodes(self) -> list[NodeClient]:
+        return [node for node in self.client.nodes if node.autoscaled]
+
+    def capacity(self, node: NodeClient) -> int:
+        return node.max_voice_clients or self.players_per_node
+
+    async def node_load(self, node: NodeClient) -> float:
+        players = len(node.voiceClients) / self.capacity(node)
+        try:
+            status = await node.getStatus()
+        except Exception:  # noqa
+            return players
+        # ProcessLoad is the cpu percent of the node process
+        return max(players, float(status.get("ProcessLoad") or 0) / 100)
+
+    async def measure(self) -> tuple[float, list[NodeClient]]:
+        nodes = [
+            node for node in self.client.nodes
+            if node.is_connected and not node.draining
+        ]
+        if not nodes:
+            return 0.0, nodes
+
+        loads = await asyncio.gather(*(self.node_load(node) for node in nodes))
+        return sum(loads) / len(loads), nodes
+
+    async def check(self) -> None:
+        self.load, nodes = await self.measure()
+        if not nodes:
+            return
+
+        local_nodes = len([node for node in nodes if node.local])
+        # the load would be spread over one node less after retiring one
+        shrunk = self.load * len(nodes) / max(len(nodes) - 1, 1)
+
+        if self.load > self.scale_up and local_nodes < self.max_cores:
+            direction = 1
+        elif (self.load < self.scale_down and shrunk < self.scale_up
+              and self.scaled_nodes):
+            direction = -1
+        else:
+            direction = 0
+
+        # counts the checks in a row which want to scale in the same direction
+        if direction == 0 or (self._streak > 0) != (direction > 0):
+            self._streak = 0
+        self._streak += direction
+
+        if abs(self._streak) < self.sustain:
+            return
+        if time.monotonic() - self._changed_at < self.cooldown:
+            return
+
+        self._streak = 0
+        self._changed_at = time.monotonic()
+        if direction > 0:
+            await self.launch()
+        else:
+            await self.retire()
+
+    async def launch(self) -> NodeClient:
+        self.logger.info(
+            f"launching a local node, load is {round(self.load * 100)}%")
+        node = await self.client.connect_node(
+            None,
+            None,
+            None,
+            None,
+            dict(self.launch_options),
+            max_voice_clients=self.players_per_node)
+        node.autoscaled = True
+        return node
+
+    async def retire(self, node: Optional[NodeClient] = None) -> None:
+        if node is None:
+            node = min(self.scaled_nodes, key=lambda n: len(n.voiceClients))
+        self.logger.info(
+            f"retiring local node {node.key}, load is {round(self.load * 100)}%"
+        )
+
+        await self.client.remove_node(node)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception:  # noqa
+                self.logger.exception("an error occurred while autoscaling")
+
+    def stop(self) -> None:
+        # the players of the node processes can't outlive the bot anyway
+        for node in self.scaled_nodes:
+            if node.process and node.process.returncode is None:
+                node.process.terminate()
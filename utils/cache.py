@@ -1,34 +1,98 @@
+import json
+from typing import Any, Optional, Union
+
 import aioredis
 import dico  # noqa
 
+from .memory_cache import MemoryBackend
+
 
 class CacheClient:
-    def __init__(self, host: str, port: int = 6379) -> None:
+    """
+    Cache calls go through ``backend``, which is a redis client or ``MemoryBackend``.
+    Both speak the same commands and return str, so call sites don't know which one is used.
+    """
+    def __init__(self,
+                 host: str = "localhost",
+                 port: int = 6379,
+                 backend: str = "redis",
+                 max_memory_mb: int = 64) -> None:
         self.host = host
         self.port = port
 
-        self.redis: aioredis.Redis = aioredis.from_url(
-            f"redis://{self.host}:{self.port}")  # type: ignore
-
-    async def get_users(self, channel: dico.Channel.TYPING) -> list[str]:
-        users: list[str] = []
+        self.backend: Union[aioredis.Redis, MemoryBackend]
+        if backend == "memory":
+            self.backend = MemoryBackend(max_memory_mb * 1024 * 1024)
+        else:
+            self.backend = aioredis.from_url(  # type: ignore
+                f"redis://{self.host}:{self.port}", decode_responses=True)
 
-        for i in range(0, await self.redis.llen(str(channel.id))):
-            users.append((await self.redis.lindex(str(channel.id),
-                                                  i)).decode())
+    async def close(self) -> None:
+        await self.backend.close()
 
-        return users
+    async def get_users(self, channel: dico.Channel.TYPING) -> list[str]:
+        return await self.backend.lrange(  # type: ignore[no-any-return]
+            str(channel.id), 0, -1)
 
     async def add_user(self, channel: dico.Channel.TYPING,
                        user: dico.User.TYPING) -> None:
         if str(user.id) in (await self.get_users(channel)):
             return
 
-        await self.redis.lpush(str(channel.id), str(user.id))
+        await self.backend.lpush(str(channel.id), str(user.id))
 
     async def delete_user(self, channel: dico.Channel.TYPING,
                           user: dico.User.TYPING) -> None:
         if str(user.id) not in (await self.get_users(channel)):
             return
 
-        await self.redis.lrem(str(channel.id), 1, str(user.id))
+        await self.backend.lrem(str(channel.id), 1, str(user.id))
+
+    async def get_hash(self, key: str) -> dict[str, str]:
+        return await self.backend.hgetall(key)  # type: ignore[no-any-return]
+
+    async def get_fields(self, key: str,
+                         fields: list[str]) -> list[Optional[str]]:
+        return await self.backend.hmget(  # type: ignore[no-any-return]
+            key, fields)
+
+    async def set_hashes(self, hashes: dict[str, dict[str, str]]) -> None:
+        async with self.backend.pipeline(transaction=False) as pipe:
+            for key, mapping in hashes.items():
+                pipe.hset(key, mapping=mapping)
+            await pipe.execute()
+
+    async def pop_json(self, key: str) -> Any:
+        value = await self.backend.get(key)
+        await self.backend.delete(key)
+        return json.loads(value) if value else None
+
+    async def set_json(self, key: str, value: Any, expire: int) -> None:
+        await self.backend.set(key, json.dumps(value), ex=expire)
+
+    async def write_aggregates(self,
+                               scores: dict[str, dict[str, float]],
+                               counters: dict[str, dict[str, float]],
+                               streams: dict[str, list[dict[str, str]]],
+                               max_members: int = 1000,
+                               max_stream_length: int = 1000) -> None:
+        async with self.backend.pipeline(transaction=False) as pipe:
+            for key, members in scores.items():
+                for member, amount in members.items():
+                    pipe.zincrby(key, amount, member)
+                # keeps the top entries only, the rest can't be ranked anyway
+                pipe.zremrangebyrank(key, 0, -(max_members + 1))
+            for key, fields in counters.items():
+                for field, amount in fields.items():
+                    pipe.hincrbyfloat(key, field, amount)
+            for key, entries in streams.items():
+                for entry in entries:
+                    pipe.xadd(key,
+                              entry,
+                              maxlen=max_stream_length,
+                              approximate=True)
+            await pipe.execute()
+
+    async def get_top(self, key: str, count: int) -> list[tuple[str, float]]:
+        return await self.backend.zrevrange(  # type: ignore[no-any-return]
+            key, 0, count - 1, withscores=True)
@@ -0,0 +1,111 @@
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import time
+from typing import Any, Callable, Iterator
+
+from .tracing import JSONLinesExporter
+
+# snowflakes, as strings or numbers, wherever they are in a payload
+_SNOWFLAKE = re.compile(r"(?<![\d.])\d{17,20}(?![\d.])")
+_SECRET = re.compile(
+    r'"(token|session_id|username|global_name|nick|avatar|email)": "(?:[^"\\]|\\.)*"'
+)
+
+
+def _default(value: Any) -> Any:
+    # node events can carry discodo models
+    if hasattr(value, "toDict"):
+        return value.toDict()
+    return str(value)
+
+
+class EventRecorder(JSONLinesExporter):
+    """
+    Captures raw gateway payloads and node events to gzipped, rotated JSON lines for replaying them later.
+    The loop only serializes a payload, ids are anonymized and secrets removed in the writer thread.
+    """
+    def __init__(self,
+                 path: str = "captures/events.jsonl.gz",
+                 application_id: Callable[[], Any] = lambda: None,
+                 max_bytes: int = 50 * 1024 * 1024,
+                 backup_count: int = 10,
+                 buffer_size: int = 100000,
+                 flush_interval: float = 1.0) -> None:
+        super().__init__(path, max_bytes, backup_count, buffer_size,
+                         flush_interval)
+        self.application_id = application_id
+        self.recorded = 0
+        # a new key every run, the same id is the same pseudonym within a capture
+        self._key = secrets.token_bytes(16)
+        self._header_for: Any = None
+
+    def anonymize_id(self, value: str) -> str:
+        digest = hmac.new(self._key, value.encode(), hashlib.sha256).digest()
+        # still looks like a snowflake, so the replayed code parses it the same way
+        return str(10**17 + int.from_bytes(digest[:8], "big") % (9 * 10**17))
+
+    def anonymize(self, data: str) -> str:
+        data = _SECRET.sub(lambda match: f'"{match.group(1)}": ""', data)
+        return _SNOWFLAKE.sub(lambda match: self.anonymize_id(match.group()),
+                              data)
+
+    def record(self, kind: str, event: str, data: Any) -> None:
+        self.recorded += 1
+        self.export({
+            "at": time.monotonic(),
+            "kind": kind,
+            "event": event,
+            # payloads are changed by the handlers later, so they are copied now
+            "data": json.dumps(data, default=_default),
+        })
+
+    def _header(self, application_id: Any) -> str:
+        return json.dumps({
+            "at": time.monotonic(),
+            "kind": "header",
+            "event": "CAPTURE",
+            "data": {
+                "application_id": self.anonymize_id(str(application_id)),
+                "started_at": time.time(),
+            },
+        }) + "\n"
+
+    def _write(self, records: list[dict[str, Any]]) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(
+                self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            self._rotate()
+
+        lines = [
+            f'{{"at": {record["at"]}, "kind": "{record["kind"]}", '
+            f'"event": {json.dumps(record["event"])}, "data": {self.anonymize(record["data"])}}}\n'
+            for record in records
+        ]
+        # every file starts with the header, so a rotated file can be replayed alone
+        application_id = self.application_id()
+        if application_id is not None and (
+                not os.path.exists(self.path)
+                or application_id != self._header_for):
+            self._header_for = application_id
+            lines.insert(0, self._header(application_id))
+
+        # each flush is a gzip member, concatenated members are one gzip stream
+        with open(self.path, "ab") as fp, gzip.GzipFile(fileobj=fp,
+                                                        mode="wb",
+                                                        compresslevel=6) as gz:
+            gz.write("".join(lines).encode())
+
+
+def read(paths: list[str]) -> Iterator[dict[str, Any]]:
+    for path in paths:
+        with gzip.open(path, "rt") as fp:
+            for line in fp:
+                if line.strip():
+                    yield json.loads(line)
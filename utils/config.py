@@ -1,10 +1,132 @@
-import contextlib
+import asyncio
 import json
-from typing import Any, Optional
+import logging
+import os
+from typing import Any, Awaitable, Callable, Optional
 
 
-def load(filename: str, mode: str) -> Optional[dict[str, Any]]:
-    with contextlib.suppress(Exception):
+class ConfigError(Exception):
+    pass
+
+
+def load(filename: str, mode: str) -> dict[str, Any]:
+    try:
         with open(filename) as fp:
-            return json.load(fp)[mode]  # type:ignore[no-any-return]
-    return None
+            config = json.load(fp)
+    except (OSError, ValueError) as exc:
+        raise ConfigError(f"cannot read '{filename}': {exc}") from exc
+
+    if not isinstance(config, dict) or mode not in config:
+        raise ConfigError(f"mode '{mode}' is not in '{filename}'")
+
+    validate(config[mode])
+    return config[mode]  # type:ignore[no-any-return]
+
+
+def validate(config: dict[str, Any]) -> None:
+    def expect(value: Any, types: Any, name: str) -> None:
+        if not isinstance(value, types):
+            raise ConfigError(f"'{name}' has invalid value {value!r}")
+
+    expect(config, dict, "config")
+    expect(config.get("token"), dict, "token")
+    expect(config["token"].get("discord"), str, "token.discord")
+    expect(config["token"].get("koreanbots", ""), str, "token.koreanbots")
+    expect(config.get("slash_command_guild"), (str, type(None)),
+           "slash_command_guild")
+    expect(config.get("owners", []), list, "owners")
+    expect(config.get("uvloop", False), bool, "uvloop")
+    expect(config.get("watchdog", {}), dict, "watchdog")
+    expect(config.get("autoscale", {}), dict, "autoscale")
+    expect(config.get("autoscale", {}).get("max_cores"), (int, type(None)),
+           "autoscale.max_cores")
+    expect(config.get("autocomplete", {}), dict, "autocomplete")
+    expect(config.get("capture", {}), dict, "capture")
+    expect(config.get("prefetch", {}), dict, "prefetch")
+    expect(config.get("interactions", {}), dict, "interactions")
+    expect(config.get("shards", {}), dict, "shards")
+    if config.get("interactions", {}).get("enabled", False):
+        expect(config["interactions"].get("public_key"), str,
+               "interactions.public_key")
+        expect(config["interactions"].get("port", 8080), int,
+               "interactions.port")
+
+    expect(config.get("node"), list, "node")
+    if not config["node"]:
+        raise ConfigError("'node' needs at least one node")
+    for index, node_conf in enumerate(config["node"]):
+        expect(node_conf, dict, f"node[{index}]")
+        expect(node_conf.get("max_heavy_requests", 4), int,
+               f"node[{index}].max_heavy_requests")
+        expect(node_conf.get("max_voice_clients"), (int, type(None)),
+               f"node[{index}].max_voice_clients")
+        expect(node_conf.get("region"), (str, type(None)),
+               f"node[{index}].region")
+        if is_local_node(node_conf):
+            continue
+        expect(node_conf.get("host"), str, f"node[{index}].host")
+        expect(node_conf.get("port"), int, f"node[{index}].port")
+        expect(node_conf.get("password"), str, f"node[{index}].password")
+
+    expect(config.get("cache"), dict, "cache")
+    backend = config["cache"].get("backend", "redis")
+    if backend not in ("redis", "memory"):
+        raise ConfigError(f"'cache.backend' has invalid value {backend!r}")
+    if backend == "redis":
+        expect(config["cache"].get("host"), str, "cache.host")
+        expect(config["cache"].get("port", 6379), int, "cache.port")
+    else:
+        expect(config["cache"].get("max_memory_mb", 64), int,
+               "cache.max_memory_mb")
+
+
+def is_local_node(node_conf: dict[str, Any]) -> bool:
+    return bool(node_conf.get("local", False)) or not any(
+        (node_conf.get(key, None) for key in ("host", "port", "password")))
+
+
+def node_key(node_conf: dict[str, Any]) -> str:
+    if is_local_node(node_conf):
+        return "local"
+    return f"{node_conf['host']}:{node_conf['port']}"
+
+
+class ConfigWatcher:
+    def __init__(self,
+                 filename: str,
+                 mode: str,
+                 callback: Callable[[dict[str, Any]], Awaitable[None]],
+                 interval: float = 5.0) -> None:
+        self.filename = filename
+        self.mode = mode
+        self.callback = callback
+        self.interval = interval
+
+        self.logger = logging.getLogger("config")
+        self._mtime = self._get_mtime()
+
+    def _get_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.filename).st_mtime
+        except OSError:
+            return None
+
+    async def watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+
+            mtime = self._get_mtime()
+            if mtime is None or mtime == self._mtime:
+                continue
+            self._mtime = mtime
+
+            try:
+                config = load(self.filename, self.mode)
+            except ConfigError as exc:
+                self.logger.error(f"ignoring changed config: {exc}")
+                continue
+
+            try:
+                await self.callback(config)
+            except Exception:  # noqa
+                self.logger.exception("an error occurred while applying config")
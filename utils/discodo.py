@@ -2,17 +2,125 @@
 Based on https://github.com/kijk2869/discodo/blob/master/discodo/client/DPYClient.py
 """
 import asyncio
+import collections
+import contextlib
 import itertools
-from typing import Any, Optional
+import json
+import secrets
+import sys
+import time
+from typing import Any, AsyncIterator, Optional
 
 import dico  # noqa
 import discodo  # noqa
 from discodo import (EventDispatcher, NodeNotConnected, Nodes,
                      VoiceClientNotFound)
-from discodo.client.node import Node, launchLocalNode  # noqa
+from discodo.client.http import HTTPClient  # noqa
+from discodo.client.models import AudioData  # noqa
+from discodo.client.node import Node  # noqa
+from discodo.utils import tcp  # noqa
+
+from . import queue_ops, regions
+from .capture import EventRecorder
+from .sources import SourceStore
+from .tracing import span
+
+
+class RequestScheduler:
+    HEAVY = "heavy"
+    CONTROL = "control"
+
+    def __init__(self, max_heavy: int = 4, max_control: int = 32) -> None:
+        self.limits = {self.HEAVY: max_heavy, self.CONTROL: max_control}
+        self._semaphores = {
+            lane: asyncio.Semaphore(limit)
+            for lane, limit in self.limits.items()
+        }
+
+        self.waiting = {lane: 0 for lane in self.limits}
+        self.in_flight = {lane: 0 for lane in self.limits}
+        self.wait_times: dict[str, collections.deque[float]] = {
+            lane: collections.deque(maxlen=1000)
+            for lane in self.limits
+        }
+
+    @contextlib.asynccontextmanager
+    async def slot(self, lane: str) -> AsyncIterator[None]:
+        self.waiting[lane] += 1
+        started = time.perf_counter()
+        try:
+            await self._semaphores[lane].acquire()
+        finally:
+            self.waiting[lane] -= 1
+        self.wait_times[lane].append(time.perf_counter() - started)
+
+        self.in_flight[lane] += 1
+        try:
+            yield
+        finally:
+            self.in_flight[lane] -= 1
+            self._semaphores[lane].release()
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        return {
+            lane: {
+                "in_flight": self.in_flight[lane],
+                "waiting": self.waiting[lane],
+                "avg_wait": (sum(self.wait_times[lane]) /
+                             len(self.wait_times[lane])
+                             if self.wait_times[lane] else 0.0),
+                "max_wait": max(self.wait_times[lane], default=0.0),
+            }
+            for lane in self.limits
+        }
+
+
+class ScheduledHTTPClient(HTTPClient):  # type: ignore[misc]
+    # extractor calls which can take seconds on the node,
+    # /putSource only extends the queue with sources resolved already
+    HEAVY_ENDPOINTS = ("/getSource", "/searchSources", "/loadSource")
+
+    async def fetch(self, method: str, endpoint: str, **kwargs: Any) -> Any:
+        lane = (RequestScheduler.HEAVY if endpoint in self.HEAVY_ENDPOINTS
+                else RequestScheduler.CONTROL)
+
+        with span(f"node{endpoint}", method=method,
+                  node=self.Node.key) as current:
+            started = time.perf_counter()
+            async with self.Node.scheduler.slot(lane):
+                if current:
+                    current.set(queue_wait_ms=round(
+                        (time.perf_counter() - started) * 1000, 3))
+                return await super().fetch(method, endpoint, **kwargs)
 
 
 class NodeClient(Node):  # type: ignore[call-arg, misc]
+    local = False
+    draining = False
+    autoscaled = False
+    process: Optional[asyncio.subprocess.Process] = None
+
+    def __init__(self,
+                 *args: Any,
+                 max_heavy_requests: int = 4,
+                 max_voice_clients: Optional[int] = None,
+                 **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+
+        self.scheduler = RequestScheduler(max_heavy=max_heavy_requests)
+        self.max_voice_clients = max_voice_clients
+
+    @property
+    def key(self) -> str:
+        if self.autoscaled:
+            return f"local:{self.port}"
+        return "local" if self.local else f"{self.host}:{self.port}"
+
+    @property
+    def saturated(self) -> bool:
+        return (self.max_voice_clients is not None
+                and len(self.voiceClients) >= self.max_voice_clients)
+
     async def onResumed(self, data: dict[str, Any]) -> None:
         await super().onResumed(data)
 
@@ -24,13 +132,67 @@ class NodeClient(Node):  # type: ignore[call-arg, misc]
             else:
                 self.loop.create_task(self.client.disconnect(guild_id))
 
+    async def onAnyEvent(self, operation: str, data: Any) -> None:
+        await super().onAnyEvent(operation, data)
+
+        if operation in ("VC_CREATED", "RESUMED"):
+            for vc in self.voiceClients.values():
+                if not isinstance(vc.http, ScheduledHTTPClient):
+                    vc.http = ScheduledHTTPClient(vc)
+
     async def close(self) -> None:
         for guild_id in self.voiceClients:
             self.loop.create_task(
                 self.client.disconnect(self.client.client.get(guild_id)))
 
 
+async def launch_local_node(
+        module: str = "discodo",
+        timeout: float = 30.0,
+        **options: Any) -> tuple[asyncio.subprocess.Process, str, int, str]:
+    """
+    Spawns a node process on a free local port and waits until it accepts connections.
+    Unlike discodo's launchLocalNode it keeps no global process, so any number of local nodes
+    can be launched, retired and launched again.
+    """
+    host, port, password = "127.0.0.1", tcp.getFreePort(), secrets.token_hex()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", module, "--config-json",
+        json.dumps({
+            **options, "HOST": host,
+            "PORT": port,
+            "PASSWORD": password
+        }))
+
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + timeout
+    try:
+        while True:
+            if process.returncode is not None:
+                raise SystemError(
+                    f"the local node exited with {process.returncode}")
+            try:
+                _, writer = await asyncio.open_connection(host, port)
+            except OSError:
+                if loop.time() > deadline:
+                    raise SystemError(
+                        f"the local node didn't listen on {port} in {timeout}s"
+                    ) from None
+                await asyncio.sleep(0.5)
+                continue
+            writer.close()
+            return process, host, port, password
+    except BaseException:
+        # also when the launch is cancelled, the process would be left running
+        if process.returncode is None:
+            process.kill()
+        raise
+
+
 class DicoClient:
+    # python module of the node server, run with -m for local nodes
+    node_module = "discodo"
+
     def __init__(self, client: dico.Client):
         self.client = client
         self.loop = client.loop or asyncio.get_event_loop()
@@ -40,6 +202,18 @@ class DicoClient:
         self.guild_reservation_map: dict[int, discodo.Node] = {}
 
         self.nodes = Nodes()
+        self.sources = SourceStore()
+
+        self._moving_guilds: set[int] = set()
+
+        # guild id -> region of its voice server, known from VOICE_SERVER_UPDATE
+        self.guild_regions: dict[int, str] = {}
+        # region -> "preferred", "fallback" or "rerouted" -> count
+        self.placements: collections.defaultdict[
+            str, collections.Counter[str]] = collections.defaultdict(
+                collections.Counter)
+        self._self_voice_states: dict[int, dict[str, Any]] = {}
+        self.recorder: Optional[EventRecorder] = None
 
         self.client.on_("raw", self.discord_dispatch)
 
@@ -48,17 +222,33 @@ class DicoClient:
             f"<DicoClient Nodes={self.nodes} voice_clients={len(self.voice_clients)}>"
         )
 
+    @property
+    def Nodes(self) -> Nodes:  # noqa
+        # discodo.Node refers to the node list of its client by this name
+        return self.nodes
+
     @property
     def event(self):  # type: ignore
         return self.dispatcher.event
 
     async def discord_dispatch(self, payload: dict[str, Any]) -> None:
+        if self.recorder:
+            self.recorder.record("gateway", payload["t"], payload)
+
+        if payload["t"] == "VOICE_STATE_UPDATE" and int(
+                payload["d"]["user_id"]) == int(self.client.application_id):
+            self._self_voice_states[int(payload["d"]["guild_id"])] = payload
+        elif payload["t"] == "VOICE_SERVER_UPDATE":
+            await self._on_voice_server_update(payload)
+
         if payload["t"] in ["VOICE_STATE_UPDATE", "VOICE_SERVER_UPDATE"]:
             vc = self.get_vc(payload["d"]["guild_id"], safe=True)
             select_nodes = [
                 self.guild_reservation_map.get(
                     int(payload["d"]["guild_id"]),
-                    (vc.Node if vc else self.get_best_node()),
+                    (vc.Node if vc else self.get_best_node(
+                                    region=self.guild_regions.get(
+                                        int(payload["d"]["guild_id"])))),
                 )
             ]
         else:
@@ -74,6 +264,28 @@ class DicoClient:
                 return_when="ALL_COMPLETED",
             )
 
+    async def _on_voice_server_update(self, payload: dict[str, Any]) -> None:
+        guild_id = int(payload["d"]["guild_id"])
+        region = regions.from_endpoint(payload["d"].get("endpoint"))
+        if not region:
+            return
+        self.guild_regions[guild_id] = region
+
+        # the node is chosen before the voice server is known, move a pending connection
+        # to a node of that region while the voice client isn't created yet
+        reserved = self.guild_reservation_map.get(guild_id)
+        if not reserved or reserved.region == region:
+            return
+        node = self.get_best_node(region=region)
+        if not node or node.region != region:
+            return
+
+        self.guild_reservation_map[guild_id] = node
+        self.placements[region]["rerouted"] += 1
+        voice_state = self._self_voice_states.get(guild_id)
+        if voice_state:
+            await node.discordDispatch(voice_state)
+
     def register_node(
         self,
         host: Optional[str] = None,
@@ -81,13 +293,16 @@ class DicoClient:
         password: Optional[str] = "hellodiscodo",
         region: Optional[str] = None,
         launch_options: Optional[dict[str, Any]] = None,
+        max_heavy_requests: int = 4,
+        max_voice_clients: Optional[int] = None,
     ) -> asyncio.Task:  # type: ignore
 
         if launch_options is None:
             launch_options = {}
 
         return self.loop.create_task(
-            self.connect_node(host, port, password, region, launch_options))
+            self.connect_node(host, port, password, region, launch_options,
+                              max_heavy_requests, max_voice_clients))
 
     async def connect_node(
         self,
@@ -96,32 +311,111 @@ class DicoClient:
         password: Optional[str],
         region: Optional[str],
         launch_options: dict[str, Any],
-    ) -> None:
+        max_heavy_requests: int = 4,
+        max_voice_clients: Optional[int] = None,
+    ) -> NodeClient:
         await self.client.wait_ready()
 
-        if not host or not port:
-            local_node_process = await launchLocalNode(**launch_options)
-
-            host = local_node_process.HOST
-            port = local_node_process.PORT
-            password = local_node_process.PASSWORD
+        local = not host or not port
+        local_node_process = None
+        if local:
+            local_node_process, host, port, password = await launch_local_node(
+                self.node_module, **launch_options)
 
         user_id = int(self.client.application_id)
         shard_id = None  # I don't know how to get shard id in dico
 
-        node = NodeClient(self, host, port, user_id, shard_id, password,
-                          region)
-        await node.connect()
+        node = NodeClient(self,
+                          host,
+                          port,
+                          user_id,
+                          shard_id,
+                          password,
+                          region,
+                          max_heavy_requests=max_heavy_requests,
+                          max_voice_clients=max_voice_clients)
+        node.local = local
+        node.process = local_node_process
+        try:
+            await node.connect()
+        except BaseException:
+            if local_node_process and local_node_process.returncode is None:
+                local_node_process.kill()
+            raise
 
         self.nodes.append(node)
         node.dispatcher.on("VC_DESTROYED", self._on_vc_destroyed)
         node.dispatcher.onAny(self._on_any_node_event)
 
+        return node
+
+    async def remove_node(self, node: NodeClient) -> None:
+        node.draining = True
+
+        await self.drain_node(node)
+        await node.destroy()
+
+        # a local node is a subprocess of the bot, it would keep running
+        if node.process and node.process.returncode is None:
+            node.process.terminate()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(node.process.wait(), 10)
+
+    async def drain_node(self, node: NodeClient) -> None:
+        for guild_id, vc in list(node.voiceClients.items()):
+            target = self.get_best_node(
+                except_node=node, region=self.guild_regions.get(guild_id))
+            try:
+                if not target:
+                    raise NodeNotConnected
+                await self.move_vc(vc, target)
+            except Exception:  # noqa
+                await self.disconnect(guild_id)
+
+    async def move_vc(self, vc: discodo.VoiceClient,
+                      node: NodeClient) -> discodo.VoiceClient:
+        guild_id = int(vc.guild_id)
+
+        await vc.fetchState()
+        current, queue = vc.current, list(vc.Queue)
+        options = {
+            "volume": vc.volume,
+            "crossfade": vc.crossfade,
+            "autoplay": vc.autoplay,
+            "filter": vc.filter,
+        }
+        context = vc.context
+
+        # destroying the old voice client must not disconnect from the channel
+        self._moving_guilds.add(guild_id)
+        try:
+            new_vc = await self.connect(guild_id, vc.channel_id, node)
+        finally:
+            self._moving_guilds.discard(guild_id)
+
+        await new_vc.setOptions(**options)
+        if context:
+            await new_vc.setContext(context)
+        if current:
+            await new_vc.putSource(current)
+        if queue:
+            await new_vc.putSource(queue)
+
+        return new_vc
+
     async def _on_vc_destroyed(self, data: dict[str, Any]) -> None:
+        if int(data["guild_id"]) in self._moving_guilds:
+            return
+
+        # the voice client is gone already, so the handlers get the guild id
+        self.dispatcher.dispatch("VC_DESTROYED", int(data["guild_id"]), data)
         await self.client.update_voice_state(data["guild_id"])
 
     async def _on_any_node_event(self, event: str, data: dict[str,
                                                               Any]) -> None:
+        if self.recorder:
+            self.recorder.record("node", event, data)
+
         if not isinstance(data, dict) or "guild_id" not in data:
             return
 
@@ -130,18 +424,81 @@ class DicoClient:
         if not vc:
             return
 
+        if event == "SOURCE_START" and data.get("source"):
+            self.sources.put(data["source"])
+
         self.dispatcher.dispatch(event, vc, data)
 
-    def get_best_node(self, except_node: discodo.Node = None) -> discodo.Node:
+    def get_best_node(self,
+                      except_node: discodo.Node = None,
+                      region: Optional[str] = None) -> discodo.Node:
         sorted_vc = sorted(
-            [node for node in self.nodes if node.is_connected],
+            [
+                node for node in self.nodes
+                if node.is_connected and not node.draining
+            ],
             key=lambda n: len(n.voiceClients),
         )
 
         if except_node and except_node in sorted_vc:
             sorted_vc.remove(except_node)
 
-        return sorted_vc[0] if sorted_vc else None
+        # saturated nodes are used only when every node is saturated
+        candidates = [node for node in sorted_vc if not node.saturated
+                      ] or sorted_vc
+        if region:
+            # falls back to the other regions when the region has no free node
+            candidates = [node for node in candidates if node.region == region
+                          ] or candidates
+
+        return candidates[0] if candidates else None
+
+    def place(self, guild_id: int) -> Optional[NodeClient]:
+        region = self.guild_regions.get(guild_id)
+        node = self.get_best_node(region=region)
+
+        if node and not region:
+            self.placements["unknown"]["placed"] += 1
+        elif node:
+            self.placements[region][
+                "preferred" if node.region == region else "fallback"] += 1
+        return node
+
+    def placement_stats(self) -> dict[str, dict[str, int]]:
+        return {
+            region: dict(counter)
+            for region, counter in self.placements.items()
+        }
+
+    async def requeue_source(self,
+                             vc: discodo.VoiceClient,
+                             source: Any,
+                             index: Optional[int] = None) -> AudioData:
+        """Puts ``source`` in the queue again, at ``index`` or at the end."""
+        resolved = self.sources.get(source["webpage_url"])
+        if resolved is None and self.sources.is_valid(source):
+            resolved = self.sources.put(source)
+
+        if resolved is None:
+            # stream url is expired, so let the node resolve it again.
+            # SOURCE_START of the new entry refreshes the store.
+            self.sources.remove(source["webpage_url"])
+            loaded = await vc.loadSource(source["webpage_url"])
+            if index is not None and not isinstance(loaded, list):
+                await vc.fetchQueue(ws=False)
+                queue = [item for item in vc.Queue if item.tag != loaded.tag]
+                if queue[index:]:
+                    await queue_ops.apply(
+                        vc, [*queue[:index], loaded, *queue[index:]])
+            return loaded
+
+        item = AudioData(vc, resolved)
+        queue = list(vc.Queue)
+        if index is None or not queue[index:]:
+            return await vc.putSource(item)
+        # the node can't insert an entry, the queue behind it is put again
+        await queue_ops.apply(vc, [*queue[:index], item, *queue[index:]])
+        return item
 
     @property
     def voice_clients(self) -> dict[int, discodo.VoiceClient]:
@@ -175,11 +532,10 @@ class DicoClient:
         guild = int(guild)
 
         if not node:
-            if not self.get_best_node():
+            node = self.place(guild)
+            if not node:
                 raise NodeNotConnected
 
-            node = self.get_best_node()
-
         self.guild_reservation_map[guild] = node
 
         vc = self.get_vc(guild, safe=True)
@@ -194,13 +550,15 @@ class DicoClient:
                 timeout=10.0,
             )) if not vc or vc.Node != node else None)
 
-        await self.client.update_voice_state(guild, channel)
+        with span("voice.update_voice_state"):
+            await self.client.update_voice_state(guild, channel)
 
         if task:
-            vc, _ = await task
+            with span("voice.wait_vc_created", node=node.key):
+                vc, _ = await task
 
-        if self.guild_reservation_map.get(guild) == node:
-            del self.guild_reservation_map[guild]
+        # VOICE_SERVER_UPDATE may have moved the reservation to another node
+        self.guild_reservation_map.pop(guild, None)
 
         return vc
 
@@ -0,0 +1,106 @@
+import asyncio
+import hashlib
+import logging
+import logging.handlers
+import queue
+import time
+import traceback
+from typing import Optional
+
+
+def fingerprint(error: BaseException) -> str:
+    # frame signature without source lines, walking the traceback is cheap
+    frames = [
+        f"{frame.f_code.co_filename}:{frame.f_code.co_name}:{lineno}"
+        for frame, lineno in traceback.walk_tb(error.__traceback__)
+    ]
+    signature = "|".join([type(error).__qualname__, *frames])
+    return hashlib.sha1(signature.encode()).hexdigest()[:10]
+
+
+class ErrorRecord:
+    def __init__(self, error: BaseException) -> None:
+        self.name = type(error).__qualname__
+        self.first_seen = time.time()
+        self.count = 0
+        self.total = 0
+        self.rendered: Optional[str] = None
+
+
+class ErrorAggregator:
+    def __init__(self, window: float = 60.0, max_records: int = 1000) -> None:
+        self.window = window
+        self.max_records = max_records
+
+        self.logger = logging.getLogger("errors")
+        self.records: dict[str, ErrorRecord] = {}
+
+    def record(self, error: BaseException) -> tuple[str, ErrorRecord]:
+        key = fingerprint(error)
+
+        record = self.records.get(key)
+        if record is None:
+            if len(self.records) >= self.max_records:
+                self.records.pop(next(iter(self.records)))
+            record = self.records[key] = ErrorRecord(error)
+
+        record.count += 1
+        record.total += 1
+        return key, record
+
+    def render(self, record: ErrorRecord, error: BaseException) -> str:
+        if record.rendered is None:
+            record.rendered = "".join(
+                traceback.format_exception(type(error), error,
+                                           error.__traceback__))
+        return record.rendered
+
+    def flush(self) -> None:
+        for key, record in list(self.records.items()):
+            if record.count > 1:
+                self.logger.warning(
+                    f"'{record.name}' ({key}) occurred {record.count} times in the last {int(self.window)}s, "
+                    f"{record.total} times in total")
+
+            if not record.count:
+                # nothing happened for a whole window, forget the traceback
+                del self.records[key]
+            else:
+                record.count = 0
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.window)
+            self.flush()
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, maxsize: int = 10000, interval: float = 60.0) -> None:
+        super().__init__(queue.Queue(maxsize))
+        self.interval = interval
+        self.dropped = 0
+        self._reported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # formatting (and rendering tracebacks) is left to the listener thread
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def report(self) -> None:
+        if self.dropped == self._reported:
+            return
+        # goes through the same queue, when it is still full it is reported next time
+        logging.getLogger("errors").warning(
+            f"dropped {self.dropped - self._reported} log records in the last {int(self.interval)}s, "
+            f"{self.dropped} in total, the log listener can't keep up")
+        self._reported = self.dropped
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            self.report()
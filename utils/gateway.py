@@ -0,0 +1,302 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Iterable, Optional
+
+import dico  # noqa
+import dico.model.gateway  # noqa
+from dico.ws.websocket import WebSocketClient
+
+from .cache import CacheClient
+from .tracing import tracer
+
+
+class GatewayState:
+    """Minimal guild and voice state which a resumed session doesn't receive again."""
+    def __init__(self) -> None:
+        self.application_id: Optional[str] = None
+        self.guild_ids: set[str] = set()
+        # (guild id, user id) -> voice state, the bot itself is in a channel of many guilds
+        self.voice_states: dict[tuple[str, str], dict[str, Any]] = {}
+
+    def update(self, event: str, data: dict[str, Any]) -> None:
+        if event == "READY":
+            self.application_id = data["application"]["id"]
+            self.guild_ids.update(guild["id"] for guild in data["guilds"])
+        elif event == "GUILD_CREATE":
+            self.guild_ids.add(data["id"])
+        elif event == "GUILD_DELETE" and not data.get("unavailable"):
+            self.guild_ids.discard(data["id"])
+            for key in [key for key in self.voice_states if key[0] == data["id"]]:
+                del self.voice_states[key]
+        elif event == "VOICE_STATE_UPDATE":
+            key = (data.get("guild_id"), data["user_id"])
+            if data.get("channel_id"):
+                # member objects are big and not needed to find the channel
+                self.voice_states[key] = {
+                    field: value
+                    for field, value in data.items() if field != "member"
+                }
+            else:
+                self.voice_states.pop(key, None)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "application_id": self.application_id,
+            "guild_ids": list(self.guild_ids),
+            "voice_states": list(self.voice_states.values()),
+        }
+
+    def load(self, data: dict[str, Any]) -> None:
+        self.application_id = data["application_id"]
+        self.guild_ids.update(data["guild_ids"])
+        for voice_state in data["voice_states"]:
+            self.voice_states[(voice_state.get("guild_id"),
+                               voice_state["user_id"])] = voice_state
+
+
+class ResumableWebSocketClient(WebSocketClient):  # type: ignore[misc]
+    state: Optional[GatewayState] = None
+    lifecycle: Optional["ShardManager"] = None
+    _shutting_down = False
+
+    def restore(self, session: dict[str, Any]) -> None:
+        self.session_id = session["session_id"]
+        self.seq = session["seq"]
+        self.reconnect_url = session["resume_url"]
+        # HELLO sends RESUME instead of IDENTIFY
+        self._reconnecting = True
+
+    def session(self) -> Optional[dict[str, Any]]:
+        if not self.session_id:
+            return None
+        return {
+            "session_id": self.session_id,
+            "seq": self.seq,
+            "resume_url": self.reconnect_url,
+        }
+
+    async def resume(self) -> None:
+        # cleared before sending, or the heartbeat task started by HELLO may stop itself
+        self._reconnecting = False
+        await super().resume()
+
+    async def process(self, resp: dico.model.gateway.GatewayResponse) -> Any:
+        if resp.op == dico.model.gateway.Opcodes.DISPATCH:
+            if self.state is not None and isinstance(resp.d, dict):
+                self.state.update(resp.t, resp.d)
+            if resp.t == "RESUMED":
+                self.event_handler.client.dispatch("SHARD_RESUMED",
+                                                   self.shard[0])
+        return await super().process(resp)
+
+    async def reconnect(self, fresh: bool = False) -> None:
+        if self._shutting_down:
+            return
+        if self.lifecycle is not None and not (self._reconnecting
+                                               or self._fresh_reconnecting):
+            self.lifecycle.on_reconnect(self.shard[0])
+        await super().reconnect(fresh)
+
+    async def suspend(self) -> None:
+        # closing with a non 1000/1001 code keeps the session resumable
+        self._shutting_down = True
+        if self.lifecycle is not None:
+            self.lifecycle.set_state(self.shard[0], "closed")
+        await self.close(4000)
+
+
+class ShardHealth:
+    __slots__ = ("shard_id", "state", "since", "reconnects", "latency",
+                 "presence_at")
+
+    def __init__(self, shard_id: int) -> None:
+        self.shard_id = shard_id
+        self.state = "connecting"
+        self.since = time.monotonic()
+        self.reconnects = 0
+        self.latency = 0.0
+        self.presence_at = 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "state": self.state,
+            "seconds": time.monotonic() - self.since,
+            "reconnects": self.reconnects,
+            "latency": self.latency,
+        }
+
+
+class ShardManager:
+    """
+    Tracks the state, latency and reconnects of every shard.
+    Presence updates are coalesced per shard and sent a few at a time, so a reconnect storm
+    doesn't spend the gateway rate limit that voice state updates need.
+    """
+    def __init__(self,
+                 client: Any,
+                 presence: Callable[[int], dict[str, Any]],
+                 interval: float = 1.0,
+                 batch_size: int = 5,
+                 min_interval: float = 15.0,
+                 reserve: int = 20,
+                 report_interval: float = 60.0) -> None:
+        self.client = client
+        self.presence = presence
+        self.interval = interval
+        # presence updates sent per interval over all shards
+        self.batch_size = batch_size
+        self.min_interval = min_interval
+        # gateway commands of a minute left for everything else
+        self.reserve = reserve
+        self.report_interval = report_interval
+
+        self.logger = logging.getLogger("gateway")
+        self.shards: dict[int, ShardHealth] = {}
+        self.sent = 0
+        self.coalesced = 0
+        self._pending: dict[int, dict[str, Any]] = {}
+
+    def _sockets(self) -> dict[int, WebSocketClient]:
+        return {shard.shard[0]: shard for shard in self.client.shards or ()}
+
+    def track(self, ws: ResumableWebSocketClient) -> None:
+        ws.lifecycle = self
+        # sent with IDENTIFY, a new session needs no separate update
+        ws.presence = self.presence(ws.shard[0])
+        self.set_state(ws.shard[0], "connecting")
+
+    def set_state(self, shard_id: int, state: str) -> None:
+        health = self.shards.setdefault(shard_id, ShardHealth(shard_id))
+        health.state = state
+        health.since = time.monotonic()
+
+    def on_ready(self, shard_id: int, resumed: bool = False) -> None:
+        self.set_state(shard_id, "resumed" if resumed else "ready")
+        # a resumed session keeps its presence
+        ws = self._sockets().get(shard_id)
+        if not resumed and (ws is None
+                            or ws.presence != self.presence(shard_id)):
+            self.queue_presence([shard_id])
+
+    def on_reconnect(self, shard_id: int) -> None:
+        self.set_state(shard_id, "reconnecting")
+        self.shards[shard_id].reconnects += 1
+
+    def queue_presence(self, shard_ids: Optional[Iterable[int]] = None) -> None:
+        for shard_id in self.shards if shard_ids is None else shard_ids:
+            if shard_id in self._pending:
+                self.coalesced += 1
+            self._pending[shard_id] = self.presence(shard_id)
+
+    def _has_room(self, ws: WebSocketClient) -> bool:
+        ratelimit = ws.ratelimit
+        if ratelimit.init_time + 60 <= time.time():
+            return True
+        return ratelimit.count < ratelimit.max_requests - self.reserve  # type: ignore[no-any-return]
+
+    async def flush(self) -> int:
+        sockets = self._sockets()
+        now = time.monotonic()
+        sent = 0
+        for shard_id in list(self._pending):
+            if sent >= self.batch_size:
+                break
+            health = self.shards.get(shard_id)
+            ws = sockets.get(shard_id)
+            if health is None or ws is None or health.state not in (
+                    "ready", "resumed"):
+                continue
+            if now - health.presence_at < self.min_interval or not self._has_room(
+                    ws):
+                continue
+
+            presence = self._pending.pop(shard_id)
+            try:
+                await ws.update_presence(**presence)
+            except Exception as exc:  # noqa
+                self._pending.setdefault(shard_id, presence)
+                self.logger.warning(
+                    f"cannot update the presence of shard {shard_id}: {exc!r}")
+                continue
+            # kept for IDENTIFY after a reconnect
+            ws.presence = presence
+            health.presence_at = now
+            sent += 1
+
+        self.sent += sent
+        return sent
+
+    def health(self) -> dict[int, dict[str, Any]]:
+        sockets = self._sockets()
+        for shard_id, health in self.shards.items():
+            if ws := sockets.get(shard_id):
+                health.latency = ws.ping
+        return {
+            shard_id: health.to_dict()
+            for shard_id, health in sorted(self.shards.items())
+        }
+
+    def stats(self) -> dict[str, float]:
+        health = self.health()
+        latencies = [
+            shard["latency"] for shard in health.values()
+            if shard["state"] in ("ready", "resumed")
+        ]
+        return {
+            "total": len(health),
+            "ready": len(latencies),
+            "reconnects": sum(shard["reconnects"] for shard in health.values()),
+            "latency": sum(latencies) / len(latencies) if latencies else 0.0,
+            "max_latency": max(latencies, default=0.0),
+            "pending_presences": len(self._pending),
+        }
+
+    async def run(self) -> None:
+        reported = time.monotonic()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:  # noqa
+                self.logger.exception("cannot update presences")
+
+            if time.monotonic() - reported >= self.report_interval:
+                reported = time.monotonic()
+                for shard_id, health in self.health().items():
+                    tracer.metric("shard.health", shard=shard_id, **health)
+
+
+class SessionStore:
+    KEY = "gateway_session"
+
+    def __init__(self, cache: CacheClient, ttl: int = 120) -> None:
+        self.cache = cache
+        self.ttl = ttl
+
+        self.logger = logging.getLogger("gateway")
+
+    async def save(self, shard_count: int,
+                   shards: tuple[ResumableWebSocketClient, ...],
+                   state: GatewayState) -> None:
+        sessions = {
+            str(shard.shard[0]): session
+            for shard in shards if (session := shard.session())
+        }
+        await self.cache.set_json(
+            self.KEY,
+            {
+                "shard_count": shard_count,
+                "sessions": sessions,
+                "state": state.to_dict(),
+            },
+            self.ttl,
+        )
+        self.logger.info(f"saved {len(sessions)} gateway sessions")
+
+    async def load(self, shard_count: int) -> Optional[dict[str, Any]]:
+        # a snapshot is used only once, a failed resume falls back to IDENTIFY anyway
+        snapshot = await self.cache.pop_json(self.KEY)
+        if not snapshot or snapshot["shard_count"] != shard_count:
+            return None
+        return snapshot  # type: ignore[no-any-return]
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Optional
+
+import discodo  # noqa
+
+from .cache import CacheClient
+
+
+class Play:
+    __slots__ = ("guild_id", "title", "url", "seconds", "finished_at")
+
+    def __init__(self, guild_id: int, title: str, url: str,
+                 seconds: float) -> None:
+        self.guild_id = guild_id
+        self.title = title
+        self.url = url
+        self.seconds = seconds
+        self.finished_at = time.time()
+
+    @property
+    def track(self) -> str:
+        return json.dumps([self.title, self.url], ensure_ascii=False)
+
+
+class PlayHistory:
+    """
+    Buffers finished plays from SOURCE_START/SOURCE_STOP and writes them in batches,
+    with the top tracks and the listening time aggregated at write time.
+    """
+    TIME_KEY = "stats:listening"
+
+    def __init__(self,
+                 cache: CacheClient,
+                 flush_interval: float = 10.0,
+                 max_buffer: int = 10000) -> None:
+        self.cache = cache
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+
+        self.logger = logging.getLogger("history")
+        self.dropped = 0
+        self._buffer: list[Play] = []
+        self._started: dict[int, float] = {}
+
+    @staticmethod
+    def top_key(guild_id: Optional[int] = None) -> str:
+        return f"stats:top:{guild_id or 'global'}"
+
+    @staticmethod
+    def history_key(guild_id: int) -> str:
+        return f"history:{guild_id}"
+
+    async def on_source_start(self, voice: discodo.VoiceClient,
+                              data: dict[str, Any]) -> None:
+        self._started[int(voice.guild_id)] = time.monotonic()
+
+    async def on_source_stop(self, voice: discodo.VoiceClient,
+                             data: dict[str, Any]) -> None:
+        started = self._started.pop(int(voice.guild_id), None)
+        source = data["source"]
+
+        seconds = source.get("position")
+        if seconds is None:
+            seconds = time.monotonic() - started if started else 0.0
+
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+        self._buffer.append(
+            Play(int(voice.guild_id), source.get("title") or "",
+                 source.get("webpage_url") or "", float(seconds)))
+
+    async def flush(self) -> None:
+        plays, self._buffer = self._buffer, []
+        if not plays:
+            return
+
+        scores: dict[str, dict[str, float]] = {}
+        listening: dict[str, float] = {}
+        streams: dict[str, list[dict[str, str]]] = {}
+        for play in plays:
+            for key in (self.top_key(play.guild_id), self.top_key()):
+                members = scores.setdefault(key, {})
+                members[play.track] = members.get(play.track, 0) + 1
+            for field in (str(play.guild_id), "global"):
+                listening[field] = listening.get(field, 0.0) + play.seconds
+            streams.setdefault(self.history_key(play.guild_id), []).append({
+                "title": play.title,
+                "url": play.url,
+                "seconds": str(round(play.seconds, 1)),
+                "finished_at": str(int(play.finished_at)),
+            })
+
+        try:
+            await self.cache.write_aggregates(scores,
+                                              {self.TIME_KEY: listening},
+                                              streams)
+        except Exception:  # noqa
+            self.dropped += len(plays)
+            raise
+
+    async def run(self) -> None:
+        # plays are dropped for a full buffer between the passes too
+        reported = self.dropped
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as exc:  # noqa
+                self.logger.warning(f"failed to write play history: {exc!r}")
+
+            if self.dropped > reported:
+                self.logger.warning(
+                    f"dropped {self.dropped - reported} plays, {self.dropped} in total"
+                )
+                reported = self.dropped
+
+    async def top_tracks(self,
+                         guild_id: Optional[int] = None,
+                         count: int = 10) -> list[tuple[str, str, int]]:
+        tracks: list[tuple[str, str, int]] = []
+        for track, score in await self.cache.get_top(self.top_key(guild_id),
+                                                     count):
+            title, url = json.loads(track)
+            tracks.append((title, url, int(score)))
+        return tracks
+
+    async def listening_time(self, guild_id: int) -> tuple[float, float]:
+        guild, total = await self.cache.get_fields(self.TIME_KEY,
+                                                   [str(guild_id), "global"])
+        return float(guild or 0), float(total or 0)
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Optional
+
+import dico_interaction as dico_inter
+from aiohttp import web
+from nacl.exceptions import BadSignatureError
+from nacl.signing import VerifyKey
+
+PING = 1
+AUTOCOMPLETE = 4
+
+PONG = 1
+DEFERRED_CHANNEL_MESSAGE = 5
+AUTOCOMPLETE_RESULT = 8
+
+
+class InteractionServer:
+    """
+    Receives interactions as Discord's HTTP webhooks instead of gateway events.
+    The interactions are handled by the same addon commands, the initial response is the HTTP response.
+    """
+    def __init__(self,
+                 bot: Any,
+                 public_key: str,
+                 host: str = "0.0.0.0",
+                 port: int = 8080,
+                 path: str = "/interactions",
+                 deadline: float = 2.5,
+                 max_skew: float = 300.0) -> None:
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.path = path
+        # Discord waits 3 seconds for the initial response
+        self.deadline = deadline
+        # older signed requests are replays
+        self.max_skew = max_skew
+
+        self.logger = logging.getLogger("interactions")
+        self.stats = {"received": 0, "rejected": 0, "deferred": 0}
+        self._verify_key = VerifyKey(bytes.fromhex(public_key))
+        self._runner: Optional[web.AppRunner] = None
+
+        self.app = web.Application()
+        self.app.router.add_post(path, self.receive)
+
+    def verify(self, request: web.Request, body: bytes) -> bool:
+        signature = request.headers.get("X-Signature-Ed25519")
+        timestamp = request.headers.get("X-Signature-Timestamp")
+        if not signature or not timestamp:
+            return False
+
+        try:
+            if abs(time.time() - int(timestamp)) > self.max_skew:
+                return False
+            self._verify_key.verify(timestamp.encode() + body,
+                                    bytes.fromhex(signature))
+        except (BadSignatureError, ValueError):
+            return False
+        return True
+
+    async def receive(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        if not self.verify(request, body):
+            self.stats["rejected"] += 1
+            return web.Response(text="invalid request signature", status=401)
+
+        payload = json.loads(body)
+        if payload["type"] == PING:
+            return web.json_response({"type": PONG})
+
+        self.stats["received"] += 1
+        client = self.bot.interaction
+        payload["respond_via_endpoint"] = False
+        payload["logger"] = client.logger
+        # built on the bot, so the handlers see its caches and voice states like gateway interactions
+        ctx = dico_inter.InteractionContext.create(self.bot, payload)
+
+        # the client responds via endpoint for gateway interactions, so it only schedules the handler
+        await client.receive(ctx)
+        done, _ = await asyncio.wait({ctx.response}, timeout=self.deadline)
+        if done:
+            return web.json_response(ctx.response.result().to_dict())
+
+        # the handler keeps running, a late initial response goes to the future nobody waits for
+        self.stats["deferred"] += 1
+        self.logger.warning(
+            f"interaction {ctx.id} wasn't answered in {self.deadline}s, deferred it"
+        )
+        if payload["type"] == AUTOCOMPLETE:
+            # autocompletes can't be deferred
+            return web.json_response({
+                "type": AUTOCOMPLETE_RESULT,
+                "data": {"choices": []}
+            })
+        # what the handler sends next becomes a followup
+        ctx.deferred = True
+        return web.json_response({"type": DEFERRED_CHANNEL_MESSAGE})
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.logger.info(
+            f"receiving interactions on http://{self.host}:{self.port}{self.path}"
+        )
+
+    async def close(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,376 @@
+"""
+In-process implementation of the redis commands CacheClient uses, for single instance deployments.
+Values are returned as str like a redis client with ``decode_responses=True``.
+"""
+import builtins
+import collections
+import contextlib
+import sys
+import time
+from typing import Any, Iterable, Iterator, Optional, Union
+
+Value = Union[str, bytes, int, float]
+
+
+class WrongTypeError(TypeError):
+    pass
+
+
+def _monotonic() -> float:
+    # some commands take an argument named "time"
+    return time.monotonic()
+
+
+def _str(value: Value) -> str:
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+def _range(items: list[Any], start: int, end: int) -> list[Any]:
+    # redis ranges include the end and accept negative indices
+    length = len(items)
+    start = max(length + start, 0) if start < 0 else start
+    end = length + end if end < 0 else end
+    return items[start:end + 1] if start <= end else []
+
+
+def _sizeof(value: Any) -> int:
+    if isinstance(value, (list, set, collections.deque)):
+        return sys.getsizeof(value) + sum(map(_sizeof, value))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            _sizeof(key) + _sizeof(item) for key, item in value.items())
+    if isinstance(value, tuple):
+        return sum(map(_sizeof, value))
+    return sys.getsizeof(value)
+
+
+class MemoryPipeline:
+    def __init__(self, backend: "MemoryBackend") -> None:
+        self.backend = backend
+        self.commands: list[tuple[str, tuple[Any, ...], dict[str, Any]]] = []
+
+    def __getattr__(self, name: str) -> Any:
+        if not hasattr(self.backend, name):
+            raise AttributeError(name)
+
+        def queue(*args: Any, **kwargs: Any) -> "MemoryPipeline":
+            self.commands.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self) -> list[Any]:
+        commands, self.commands = self.commands, []
+        with self.backend.batch():
+            return [
+                await getattr(self.backend, name)(*args, **kwargs)
+                for name, args, kwargs in commands
+            ]
+
+    async def __aenter__(self) -> "MemoryPipeline":
+        return self
+
+    async def __aexit__(self, *_: Any) -> None:
+        self.commands = []
+
+
+class MemoryBackend:
+    def __init__(self, max_memory: int = 64 * 1024 * 1024) -> None:
+        self.max_memory = max_memory
+        self.used_memory = 0
+        self.evicted = 0
+
+        # least recently used first
+        self._data: collections.OrderedDict[str, Any] = collections.OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self._expires: dict[str, float] = {}
+        self._stream_ids: dict[str, int] = {}
+        self._last_sweep = time.monotonic()
+        # keys written in a pipeline, their size is measured once at the end
+        self._batched: Optional[builtins.set[str]] = None
+
+    def _lookup(self, name: str, kind: Optional[type] = None) -> Any:
+        expires = self._expires.get(name)
+        if expires is not None and expires <= time.monotonic():
+            self._remove(name)
+        if name not in self._data:
+            return None
+
+        value = self._data[name]
+        if kind is not None and not isinstance(value, kind):
+            raise WrongTypeError(
+                "WRONGTYPE Operation against a key holding the wrong kind of value"
+            )
+        self._data.move_to_end(name)
+        return value
+
+    def _create(self, name: str, kind: type) -> Any:
+        value = self._lookup(name, kind)
+        if value is None:
+            value = self._data[name] = kind()
+        return value
+
+    def _remove(self, name: str) -> bool:
+        if name not in self._data:
+            return False
+        del self._data[name]
+        self.used_memory -= self._sizes.pop(name, 0)
+        self._expires.pop(name, None)
+        self._stream_ids.pop(name, None)
+        return True
+
+    @contextlib.contextmanager
+    def batch(self) -> Iterator[None]:
+        self._batched = builtins.set()
+        try:
+            yield
+        finally:
+            names, self._batched = self._batched, None
+            for name in names:
+                self._written(name)
+
+    def _written(self, name: str) -> None:
+        if self._batched is not None:
+            self._batched.add(name)
+            return
+
+        value = self._data.get(name)
+        if value is not None and not value and not isinstance(value, str):
+            # like redis, empty collections don't exist
+            self._remove(name)
+        elif value is not None:
+            size = _sizeof(name) + _sizeof(value)
+            self.used_memory += size - self._sizes.get(name, 0)
+            self._sizes[name] = size
+        self._evict()
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        if now - self._last_sweep >= 1.0 or self.used_memory > self.max_memory:
+            self._last_sweep = now
+            for name in [
+                    name for name, expires in self._expires.items()
+                    if expires <= now
+            ]:
+                self._remove(name)
+
+        # allkeys-lru, the key written last is kept even when it is over the budget alone
+        while self.used_memory > self.max_memory and len(self._data) > 1:
+            self._remove(next(iter(self._data)))
+            self.evicted += 1
+
+    # keys
+    async def delete(self, *names: str) -> int:
+        return sum(self._remove(name) for name in names)
+
+    async def exists(self, *names: str) -> int:
+        return sum(self._lookup(name) is not None for name in names)
+
+    async def expire(self, name: str, time: Union[int, float]) -> bool:
+        if self._lookup(name) is None:
+            return False
+        self._expires[name] = _monotonic() + time
+        return True
+
+    async def ttl(self, name: str) -> int:
+        if self._lookup(name) is None:
+            return -2
+        if name not in self._expires:
+            return -1
+        return int(self._expires[name] - _monotonic())
+
+    # strings
+    async def get(self, name: str) -> Optional[str]:
+        return self._lookup(name, str)  # type: ignore[no-any-return]
+
+    async def set(self,
+                  name: str,
+                  value: Value,
+                  ex: Optional[Union[int, float]] = None) -> bool:
+        self._remove(name)
+        self._data[name] = _str(value)
+        if ex is not None:
+            self._expires[name] = _monotonic() + ex
+        self._written(name)
+        return True
+
+    # lists
+    async def lpush(self, name: str, *values: Value) -> int:
+        items = self._create(name, collections.deque)
+        items.extendleft(map(_str, values))
+        self._written(name)
+        return len(items)
+
+    async def rpush(self, name: str, *values: Value) -> int:
+        items = self._create(name, collections.deque)
+        items.extend(map(_str, values))
+        self._written(name)
+        return len(items)
+
+    async def llen(self, name: str) -> int:
+        return len(self._lookup(name, collections.deque) or ())
+
+    async def lindex(self, name: str, index: int) -> Optional[str]:
+        items = self._lookup(name, collections.deque) or ()
+        try:
+            return items[index]  # type: ignore[no-any-return]
+        except IndexError:
+            return None
+
+    async def lrange(self, name: str, start: int, end: int) -> list[str]:
+        return _range(list(self._lookup(name, collections.deque) or ()),
+                      start, end)
+
+    async def lrem(self, name: str, count: int, value: Value) -> int:
+        items = self._lookup(name, collections.deque)
+        if items is None:
+            return 0
+
+        value = _str(value)
+        ordered = list(items) if count >= 0 else list(reversed(items))
+        removed = 0
+        kept: list[str] = []
+        for item in ordered:
+            if item == value and (not count or removed < abs(count)):
+                removed += 1
+                continue
+            kept.append(item)
+
+        items.clear()
+        items.extend(kept if count >= 0 else reversed(kept))
+        self._written(name)
+        return removed
+
+    # sets
+    async def sadd(self, name: str, *values: Value) -> int:
+        items = self._create(name, set)
+        before = len(items)
+        items.update(map(_str, values))
+        self._written(name)
+        return len(items) - before
+
+    async def srem(self, name: str, *values: Value) -> int:
+        items = self._lookup(name, set)
+        if items is None:
+            return 0
+        before = len(items)
+        items.difference_update(map(_str, values))
+        self._written(name)
+        return before - len(items)
+
+    async def smembers(self, name: str) -> builtins.set[str]:
+        return set(self._lookup(name, set) or ())
+
+    async def sismember(self, name: str, value: Value) -> bool:
+        return _str(value) in (self._lookup(name, set) or ())
+
+    # hashes, sorted sets are kept as _SortedSet so they can't be mistaken for hashes
+    async def hget(self, name: str, key: str) -> Optional[str]:
+        return (self._lookup(name, _Hash) or {}).get(key)
+
+    async def hgetall(self, name: str) -> dict[str, str]:
+        return dict(self._lookup(name, _Hash) or {})
+
+    async def hmget(self, name: str, keys: Iterable[str]) -> list[Optional[str]]:
+        fields = self._lookup(name, _Hash) or {}
+        return [fields.get(key) for key in keys]
+
+    async def hset(self,
+                   name: str,
+                   key: Optional[str] = None,
+                   value: Optional[Value] = None,
+                   mapping: Optional[dict[str, Value]] = None) -> int:
+        fields = self._create(name, _Hash)
+        items = dict(mapping or {})
+        if key is not None and value is not None:
+            items[key] = value
+
+        added = sum(field not in fields for field in items)
+        fields.update(
+            {field: _str(value)
+             for field, value in items.items()})
+        self._written(name)
+        return added
+
+    async def hincrbyfloat(self, name: str, key: str, amount: float = 1.0) -> float:
+        fields = self._create(name, _Hash)
+        value = float(fields.get(key, 0)) + amount
+        fields[key] = repr(value)
+        self._written(name)
+        return value
+
+    async def zincrby(self, name: str, amount: float, value: Value) -> float:
+        scores = self._create(name, _SortedSet)
+        member = _str(value)
+        scores[member] = scores.get(member, 0.0) + amount
+        self._written(name)
+        return scores[member]  # type: ignore[no-any-return]
+
+    async def zscore(self, name: str, value: Value) -> Optional[float]:
+        return (self._lookup(name, _SortedSet) or {}).get(_str(value))
+
+    async def zremrangebyrank(self, name: str, min: int, max: int) -> int:
+        scores = self._lookup(name, _SortedSet)
+        if scores is None:
+            return 0
+        removed = _range(scores.ordered(), min, max)
+        for member, _ in removed:
+            del scores[member]
+        self._written(name)
+        return len(removed)
+
+    async def zrevrange(self,
+                        name: str,
+                        start: int,
+                        end: int,
+                        withscores: bool = False) -> list[Any]:
+        scores = self._lookup(name, _SortedSet)
+        if scores is None:
+            return []
+        items = _range(scores.ordered()[::-1], start, end)
+        return items if withscores else [member for member, _ in items]
+
+    # streams
+    async def xadd(self,
+                   name: str,
+                   fields: dict[str, Value],
+                   maxlen: Optional[int] = None,
+                   approximate: bool = True) -> str:
+        entries = self._create(name, _Stream)
+        sequence = self._stream_ids.get(name, 0)
+        self._stream_ids[name] = sequence + 1
+
+        entry_id = f"{int(time.time() * 1000)}-{sequence}"
+        entries.append(
+            (entry_id, {key: _str(value)
+                        for key, value in fields.items()}))
+        if maxlen is not None:
+            del entries[:-maxlen or len(entries)]
+        self._written(name)
+        return entry_id
+
+    async def xlen(self, name: str) -> int:
+        return len(self._lookup(name, _Stream) or ())
+
+    def pipeline(self, transaction: bool = True) -> MemoryPipeline:
+        # commands run one by one without awaiting anything else, so they are atomic anyway
+        return MemoryPipeline(self)
+
+    async def close(self) -> None:
+        self._data.clear()
+        self._sizes.clear()
+        self._expires.clear()
+        self.used_memory = 0
+
+
+class _Hash(dict):  # type: ignore[type-arg]
+    pass
+
+
+class _SortedSet(dict):  # type: ignore[type-arg]
+    def ordered(self) -> list[tuple[str, float]]:
+        return sorted(self.items(), key=lambda item: (item[1], item[0]))
+
+
+class _Stream(list):  # type: ignore[type-arg]
+    pass
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Optional
+
+import dico  # noqa
+
+
+class Panel:
+    def __init__(self,
+                 guild_id: int,
+                 channel_id: int,
+                 message_id: int,
+                 position: float,
+                 duration: float,
+                 tag: Optional[str] = None) -> None:
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.message_id = message_id
+        # tag of the track on the panel
+        self.tag = tag
+
+        self.position = position
+        self.duration = duration
+        self.synced_at = time.monotonic()
+        self.paused = False
+        self.next_update = 0.0
+        self.failures = 0
+
+    @property
+    def current_position(self) -> float:
+        if self.paused:
+            return self.position
+
+        position = self.position + time.monotonic() - self.synced_at
+        return min(position, self.duration) if self.duration else position
+
+    def sync(self, position: float, duration: Optional[float] = None) -> None:
+        self.position = position
+        self.synced_at = time.monotonic()
+        if duration is not None:
+            self.duration = duration
+
+    def interval(self, min_interval: float, max_interval: float) -> float:
+        if not self.duration:
+            return max_interval
+
+        # the progress bar has 16 cells, so redraw as often as a cell moves
+        return max(min_interval, min(max_interval, self.duration / 16))
+
+
+class NowPlayingUpdater:
+    MAX_FAILURES = 3
+
+    def __init__(self,
+                 client: dico.Client,
+                 render: Callable[[Panel], Optional[dico.Embed]],
+                 tick: float = 1.0,
+                 edits_per_tick: int = 5,
+                 min_interval: float = 5.0,
+                 max_interval: float = 60.0) -> None:
+        self.client = client
+        self.render = render
+        self.tick = tick
+        self.edits_per_tick = edits_per_tick
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+        self.logger = logging.getLogger("nowplaying")
+        self.panels: dict[int, Panel] = {}
+        self._task: Optional[asyncio.Task] = None  # type: ignore
+
+    def start(self) -> None:
+        if not self._task or self._task.done():
+            self._task = self.client.loop.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def add(self, panel: Panel) -> Optional[Panel]:
+        previous = self.panels.get(panel.guild_id)
+        self.panels[panel.guild_id] = panel
+        return previous
+
+    def remove(self, guild_id: int) -> Optional[Panel]:
+        return self.panels.pop(int(guild_id), None)
+
+    def get(self, guild_id: int) -> Optional[Panel]:
+        return self.panels.get(int(guild_id))
+
+    def sync(self,
+             guild_id: int,
+             position: float,
+             duration: Optional[float] = None) -> None:
+        if panel := self.get(guild_id):
+            panel.sync(position, duration)
+            panel.next_update = 0.0
+
+    def refresh(self, guild_id: int) -> None:
+        if panel := self.get(guild_id):
+            panel.next_update = 0.0
+
+    def pause(self, guild_id: int) -> None:
+        if panel := self.get(guild_id):
+            panel.sync(panel.current_position)
+            panel.paused = True
+            panel.next_update = 0.0
+
+    def resume(self, guild_id: int) -> None:
+        if panel := self.get(guild_id):
+            panel.sync(panel.position)
+            panel.paused = False
+            panel.next_update = 0.0
+
+    async def _update(self, panel: Panel) -> None:
+        embed = self.render(panel)
+        if embed is None:
+            # nothing to draw for now, like between two tracks
+            return
+
+        await self.client.edit_message(panel.channel_id,
+                                       panel.message_id,
+                                       embed=embed)
+        panel.failures = 0
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.tick)
+
+            now = time.monotonic()
+            due = sorted(
+                (panel for panel in self.panels.values()
+                 if panel.next_update <= now),
+                key=lambda p: p.next_update,
+            )[:self.edits_per_tick]
+
+            for panel in due:
+                # a paused panel is drawn once and then left until resumed
+                panel.next_update = (float("inf") if panel.paused else now +
+                                     panel.interval(self.min_interval,
+                                                    self.max_interval))
+
+            results = await asyncio.gather(
+                *(self._update(panel) for panel in due),
+                return_exceptions=True,
+            )
+            for panel, result in zip(due, results):
+                if isinstance(result, Exception):
+                    panel.failures += 1
+                    self.logger.warning(
+                        f"failed to update now playing panel of guild {panel.guild_id}: {result!r}"
+                    )
+                    # the message is most likely deleted or not accessible
+                    if panel.failures >= self.MAX_FAILURES:
+                        self.remove(panel.guild_id)
@@ -0,0 +1,192 @@
+import asyncio
+import collections
+import contextlib
+import logging
+import time
+from typing import Any, Optional
+
+import discodo  # noqa
+from discodo.client.models import AudioData  # noqa
+
+from . import queue_ops
+from .discodo import DicoClient
+from .tracing import detached, tracer
+
+
+class QueuePrefetcher:
+    """
+    Resolves ``depth`` queue entries after the next one ahead of time, so a track change doesn't
+    wait for the node to extract the stream url. The node preloads the next entry itself.
+    Only cold entries near the end of the queue are resolved, the node can't replace an entry
+    without putting the entries after it again. The silence between tracks is measured to see
+    whether it works.
+    """
+    def __init__(self,
+                 client: DicoClient,
+                 depth: int = 2,
+                 max_concurrency: int = 4,
+                 max_rebuild: int = 5,
+                 delay: float = 0.5) -> None:
+        self.client = client
+        self.depth = depth
+        # the node can't replace an entry in place, the entries after it are deleted and put again
+        self.max_rebuild = max_rebuild
+        # queue events come in bursts, a guild is checked once after them
+        self.delay = delay
+
+        self.logger = logging.getLogger("prefetch")
+        self.gaps: collections.deque[float] = collections.deque(maxlen=1000)
+        self.counts = collections.Counter[str]()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._pending: dict[int, asyncio.Task] = {}  # type: ignore[type-arg]
+        # the node starts the next track before the current one stops when it is loaded in time
+        self._started: dict[int, str] = {}
+        self._stopped: dict[int, float] = {}
+        # guilds whose queue changed while they were being warmed
+        self._changed: set[int] = set()
+
+    def is_warm(self, item: Any) -> bool:
+        # an AudioSource is loaded on the node already
+        if not isinstance(item, AudioData):
+            return True
+        return bool(item.get("url")) and self.client.sources.is_valid(item)
+
+    def schedule(self, vc: discodo.VoiceClient) -> None:
+        guild_id = int(vc.guild_id)
+        task = self._pending.get(guild_id)
+        if task and not task.done():
+            self._changed.add(guild_id)
+            return
+        with detached():
+            self._pending[guild_id] = self.client.loop.create_task(
+                self._warm_later(vc))
+
+    async def _warm_later(self, vc: discodo.VoiceClient) -> None:
+        guild_id = int(vc.guild_id)
+        await asyncio.sleep(self.delay)
+        self._changed.discard(guild_id)
+        try:
+            await self.warm(vc)
+        except Exception:  # noqa
+            self.logger.exception(
+                f"an error occurred while prefetching the queue of {guild_id}"
+            )
+        finally:
+            self._pending.pop(guild_id, None)
+
+        if guild_id in self._changed:
+            self._changed.discard(guild_id)
+            self.schedule(vc)
+
+    async def resolve(self, vc: discodo.VoiceClient,
+                      item: AudioData) -> Optional[dict[str, Any]]:
+        url = item.get("webpage_url")
+        if not url:
+            return None
+
+        resolved = self.client.sources.get(url)
+        if resolved is not None:
+            self.counts["stored"] += 1
+            return resolved
+
+        async with self._semaphore:
+            try:
+                source = await vc.getSource(url)
+            except Exception as exc:  # noqa
+                self.counts["failed"] += 1
+                self.logger.warning(f"cannot prefetch {url}: {exc!r}")
+                return None
+
+        self.counts["resolved"] += 1
+        return self.client.sources.put(source)
+
+    async def warm(self, vc: discodo.VoiceClient) -> int:
+        queue = list(vc.Queue)
+        # the first entry is left to the node, deleting it could leave the player without one.
+        # swapping an entry puts every entry after it again, deeper ones are left cold
+        first = max(1, len(queue) - self.max_rebuild)
+        cold = [
+            index for index in range(1, min(len(queue), self.depth + 1))
+            if not self.is_warm(queue[index])
+        ]
+        self.counts["skipped"] += len([index for index in cold if index < first])
+        cold = [index for index in cold if index >= first]
+        if not cold:
+            return 0
+
+        resolved = await asyncio.gather(
+            *(self.resolve(vc, queue[index]) for index in cold))
+
+        new_queue = list(queue)
+        for index, source in zip(cold, resolved):
+            if source is not None:
+                source["context"] = queue[index].get("context") or {}
+                new_queue[index] = AudioData(vc, source)
+        swapped = {
+            queue[index].tag: new_queue[index].tag
+            for index in cold if new_queue[index].tag != queue[index].tag
+        }
+        if not swapped:
+            return 0
+
+        # entries may have been played, added or moved while resolving, then it is tried again
+        if [item.tag for item in vc.Queue] != [item.tag for item in queue]:
+            self._changed.add(int(vc.guild_id))
+            return 0
+
+        requests = await queue_ops.apply(vc, new_queue)
+        self.counts["swapped"] += len(swapped)
+        # things kept by the tag of an entry have to follow it
+        self.client.dispatcher.dispatch("QUEUE_SWAPPED", vc,
+                                        {"tags": swapped})
+        return requests
+
+    def record_gap(self, gap: float) -> None:
+        self.gaps.append(gap)
+        tracer.metric("track.gap", seconds=gap)
+
+    async def on_source_start(self, voice: discodo.VoiceClient,
+                              data: dict[str, Any]) -> None:
+        stopped = self._stopped.pop(int(voice.guild_id), None)
+        if stopped is not None:
+            # the previous track stopped before this one was loaded
+            self.record_gap(time.monotonic() - stopped)
+        else:
+            self._started[int(voice.guild_id)] = data["source"]["tag"]
+        self.schedule(voice)
+
+    async def on_source_stop(self, voice: discodo.VoiceClient,
+                             data: dict[str, Any]) -> None:
+        started = self._started.pop(int(voice.guild_id), None)
+        if started is not None and started != data["source"]["tag"]:
+            # the next track was preloaded and started first, nothing was silent
+            self.record_gap(0.0)
+        elif voice.Queue:
+            # measured only when there is a next track to wait for
+            self._stopped[int(voice.guild_id)] = time.monotonic()
+
+    async def on_queue_event(self, voice: discodo.VoiceClient,
+                             data: dict[str, Any]) -> None:
+        self.schedule(voice)
+
+    async def on_vc_destroyed(self, guild_id: int,
+                              data: dict[str, Any]) -> None:
+        self._started.pop(guild_id, None)
+        self._stopped.pop(guild_id, None)
+
+    def stats(self) -> dict[str, float]:
+        gaps = sorted(self.gaps)
+        if not gaps:
+            return {"p50": 0.0, "p99": 0.0, "max": 0.0, **self.counts}
+        return {
+            "p50": gaps[len(gaps) // 2],
+            "p99": gaps[min(len(gaps) - 1, int(len(gaps) * 0.99))],
+            "max": gaps[-1],
+            **self.counts,
+        }
+
+    def stop(self) -> None:
+        for task in self._pending.values():
+            with contextlib.suppress(Exception):
+                task.cancel()
+        self._pending.clear()
@@ -0,0 +1,108 @@
+import asyncio
+from typing import Any, Callable, Hashable
+
+import discodo  # noqa
+
+
+def remove_range(queue: list[Any], start: int, end: int) -> list[Any]:
+    return queue[:start] + queue[end + 1:]
+
+
+def remove_by(queue: list[Any], predicate: Callable[[Any],
+                                                   bool]) -> list[Any]:
+    return [item for item in queue if not predicate(item)]
+
+
+def dedupe(queue: list[Any], key: Callable[[Any], Hashable]) -> list[Any]:
+    seen: set[Hashable] = set()
+    result: list[Any] = []
+    for item in queue:
+        if key(item) in seen:
+            continue
+        seen.add(key(item))
+        result.append(item)
+    return result
+
+
+def move(queue: list[Any], source: int, destination: int) -> list[Any]:
+    result = list(queue)
+    result.insert(destination, result.pop(source))
+    return result
+
+
+def diff(old: list[str], new: list[str]) -> tuple[list[str], int]:
+    """
+    Returns the tags to remove and the index of ``new`` from which entries have to be put again.
+    The node can only remove entries by tag and append entries, so reordering rebuilds the suffix.
+    """
+    new_tags = set(new)
+    removed = [tag for tag in old if tag not in new_tags]
+    kept = [tag for tag in old if tag in new_tags]
+
+    start = next(
+        (index for index, (before, after) in enumerate(zip(kept, new))
+         if before != after),
+        min(len(kept), len(new)),
+    )
+    return removed, start
+
+
+async def apply(vc: discodo.VoiceClient, new_queue: list[Any]) -> int:
+    """Applies ``new_queue`` to the node with as few requests as possible and returns the request count."""
+    old_queue = list(vc.Queue)
+    removed, start = diff([item.tag for item in old_queue],
+                          [item.tag for item in new_queue])
+
+    new_tags = {item.tag for item in new_queue}
+    rebuilt = [item.tag for item in old_queue if item.tag in new_tags][start:]
+
+    tags = removed + rebuilt
+    requests = len(tags)
+    results = await asyncio.gather(
+        *(vc.http.removeQueueSource(tag) for tag in tags),
+        return_exceptions=True,
+    )
+    failed = [tag for tag, result in zip(tags, results)
+              if isinstance(result, BaseException)]
+    suffix = new_queue[start:]
+    if failed:
+        # an entry can start playing meanwhile, then it is not in the queue anymore.
+        # the node answers a missing tag with a server error, so the queue tells which failed
+        await vc.fetchQueue(ws=False)
+        requests += 1
+        remaining = {item.tag for item in vc.Queue}
+        played = {tag for tag in failed if tag not in remaining}
+        suffix = [item for item in suffix if item.tag not in played]
+
+        stuck = [tag for tag in failed if tag in remaining]
+        if stuck:
+            # removed once more, so the suffix is put again in order
+            results = await asyncio.gather(
+                *(vc.http.removeQueueSource(tag) for tag in stuck),
+                return_exceptions=True,
+            )
+            requests += len(stuck)
+            errors = [
+                result for result in results
+                if isinstance(result, BaseException)
+            ]
+            if errors:
+                # the entries still there stay where they are and the deleted ones are put
+                # back behind them, the order of the suffix is lost but no entry is
+                stuck_tags = {
+                    tag
+                    for tag, result in zip(stuck, results)
+                    if isinstance(result, BaseException)
+                }
+                lost = [item for item in suffix if item.tag not in stuck_tags]
+                if lost:
+                    await vc.putSource(lost)
+                await vc.fetchQueue(ws=False)
+                raise errors[0]
+
+    if suffix:
+        await vc.putSource(suffix)
+        requests += 1
+
+    await vc.fetchQueue(ws=False)
+    return requests + 1
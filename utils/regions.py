@@ -0,0 +1,67 @@
+import re
+from typing import Optional
+
+# voice server names and airport codes in VOICE_SERVER_UPDATE endpoints -> node region
+REGIONS: dict[str, str] = {
+    **dict.fromkeys(
+        ("seoul", "korea", "southkorea", "icn", "japan", "nrt", "hnd", "kix",
+         "hongkong", "hkg", "singapore", "sin", "tpe"), "asia"),
+    **dict.fromkeys(("india", "bom", "del", "maa"), "india"),
+    **dict.fromkeys(("sydney", "syd", "mel", "akl"), "oceania"),
+    **dict.fromkeys(
+        ("europe", "rotterdam", "amsterdam", "ams", "frankfurt", "fra",
+         "london", "lhr", "paris", "cdg", "madrid", "mad", "milan", "mxp",
+         "stockholm", "arn", "waw", "russia", "svo"), "europe"),
+    **dict.fromkeys(
+        ("us-west", "us-east", "us-central", "us-south", "atlanta", "atl",
+         "newark", "ewr", "iad", "ord", "dfw", "lax", "sea", "sjc", "mia",
+         "yyz"), "us"),
+    **dict.fromkeys(("brazil", "gru", "santiago", "scl", "bog"),
+                    "south-america"),
+    **dict.fromkeys(("southafrica", "jnb", "cpt"), "africa"),
+    **dict.fromkeys(("dubai", "dxb", "tlv"), "middle-east"),
+}
+
+# legacy "seoul1234.discord.media", "south-korea1.discord.media"
+# and current "c-icn04-1a2b3c4d.discord.media"
+_ENDPOINT = re.compile(r"^(?:c-)?([a-z]+(?:-[a-z]+)*)\d*")
+
+
+def from_endpoint(endpoint: Optional[str]) -> Optional[str]:
+    """
+    Returns the node region of a voice server endpoint, or None if it is unknown.
+
+    >>> for endpoint in ("c-icn04-1a2b3c4d.discord.media:443",
+    ...                  "c-fra09-5e6f7a8b.discord.media", "seoul1234.discord.media",
+    ...                  "south-korea1.discord.media", "us-east123.discord.media",
+    ...                  "us-south45.discord.media", "hongkong7.discord.media",
+    ...                  "c-zzz01-00000000.discord.media", "unknown42.discord.media",
+    ...                  "1234.discord.media", ""):
+    ...     print(endpoint, from_endpoint(endpoint))
+    c-icn04-1a2b3c4d.discord.media:443 asia
+    c-fra09-5e6f7a8b.discord.media europe
+    seoul1234.discord.media asia
+    south-korea1.discord.media asia
+    us-east123.discord.media us
+    us-south45.discord.media us
+    hongkong7.discord.media asia
+    c-zzz01-00000000.discord.media None
+    unknown42.discord.media None
+    1234.discord.media None
+     None
+    """
+    if not endpoint:
+        return None
+
+    match = _ENDPOINT.match(endpoint.lower())
+    if not match:
+        return None
+
+    # a name can be followed by the index of the server, such as "us-east123",
+    # and legacy names can have several parts, such as "south-korea1"
+    name = match.group(1)
+    parts = name.split("-")
+    for candidate in (name, "".join(parts), *parts):
+        if candidate in REGIONS:
+            return REGIONS[candidate]
+    return None
@@ -0,0 +1,84 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from typing import Any
+
+import dico  # noqa
+
+from .cache import CacheClient
+
+
+class GuildSettingsStore:
+    DEFAULTS: dict[str, Any] = {"volume": 1.0, "autoplay": True, "loop": "off"}
+
+    def __init__(self,
+                 cache: CacheClient,
+                 flush_interval: float = 5.0,
+                 max_cached: int = 10000) -> None:
+        self.cache = cache
+        self.flush_interval = flush_interval
+        self.max_cached = max_cached
+
+        self.logger = logging.getLogger("settings")
+        self._settings: OrderedDict[int, dict[str, Any]] = OrderedDict()
+        self._dirty: dict[int, dict[str, Any]] = {}
+
+    @staticmethod
+    def key(guild_id: int) -> str:
+        return f"guild_settings:{guild_id}"
+
+    async def get(self, guild: dico.Guild.TYPING) -> dict[str, Any]:
+        guild_id = int(guild)
+        if guild_id not in self._settings:
+            stored = await self.cache.get_hash(self.key(guild_id))
+            settings = {
+                **self.DEFAULTS,
+                **{field: json.loads(value)
+                   for field, value in stored.items()}
+            }
+            # updates which are not written yet win over redis
+            settings.update(self._dirty.get(guild_id, {}))
+            self._settings[guild_id] = settings
+
+            while len(self._settings) > self.max_cached:
+                self._settings.popitem(last=False)
+
+        self._settings.move_to_end(guild_id)
+        return dict(self._settings[guild_id])
+
+    def update(self, guild: dico.Guild.TYPING, **values: Any) -> None:
+        guild_id = int(guild)
+        if guild_id in self._settings:
+            self._settings[guild_id].update(values)
+        self._dirty.setdefault(guild_id, {}).update(values)
+
+    async def flush(self) -> None:
+        dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+
+        try:
+            await self.cache.set_hashes({
+                self.key(guild_id): {
+                    field: json.dumps(value)
+                    for field, value in values.items()
+                }
+                for guild_id, values in dirty.items()
+            })
+        except Exception:  # noqa
+            # write them again with the next batch
+            for guild_id, values in dirty.items():
+                self._dirty[guild_id] = {
+                    **values,
+                    **self._dirty.get(guild_id, {})
+                }
+            raise
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as exc:  # noqa
+                self.logger.warning(f"failed to write guild settings: {exc!r}")
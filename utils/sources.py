@@ -0,0 +1,72 @@
+import time
+import urllib.parse
+import uuid
+from collections import OrderedDict
+from typing import Any, Optional
+
+# keys which are only meaningful while the source is being played
+VOLATILE_KEYS = ("position", "seekable", "as_of")
+
+
+class SourceStore:
+    def __init__(self,
+                 max_size: int = 1024,
+                 default_ttl: float = 60 * 60 * 3,
+                 margin: float = 60 * 5) -> None:
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.margin = margin
+
+        self._sources: OrderedDict[str, tuple[dict[str, Any],
+                                              float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sources)
+
+    def __contains__(self, url: str) -> bool:
+        return self.get(url) is not None
+
+    def expires_at(self, source: Any) -> float:
+        query = urllib.parse.parse_qs(
+            urllib.parse.urlparse(source.get("url") or "").query)
+        with_expire = query.get("expire")
+        if with_expire and with_expire[0].isdigit():
+            return float(with_expire[0])
+        return time.time() + self.default_ttl
+
+    def is_valid(self, source: Any) -> bool:
+        return self.expires_at(source) - self.margin > time.time()
+
+    def get(self, url: str) -> Optional[dict[str, Any]]:
+        if url not in self._sources:
+            return None
+
+        source, expires_at = self._sources[url]
+        if expires_at - self.margin <= time.time():
+            del self._sources[url]
+            return None
+
+        self._sources.move_to_end(url)
+        # every queue entry needs its own tag on the node
+        return {**source, "tag": str(uuid.uuid4())}
+
+    def put(self, source: Any) -> dict[str, Any]:
+        if hasattr(source, "toDict"):
+            source = source.toDict()
+        source = {
+            key: value
+            for key, value in source.items() if key not in VOLATILE_KEYS
+        }
+        # the node restores AudioSource at its last position, AudioData at start_position
+        source.update({"_type": "AudioData", "start_position": 0.0})
+
+        self._sources[source["webpage_url"]] = (source,
+                                                self.expires_at(source))
+        self._sources.move_to_end(source["webpage_url"])
+        while len(self._sources) > self.max_size:
+            self._sources.popitem(last=False)
+
+        return {**source, "tag": str(uuid.uuid4())}
+
+    def remove(self, url: str) -> None:
+        self._sources.pop(url, None)
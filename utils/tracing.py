@@ -0,0 +1,191 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import secrets
+import time
+from typing import Any, Awaitable, Callable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attrs",
+                 "sampled", "started_at", "_started", "error")
+
+    def __init__(self,
+                 name: str,
+                 parent: Optional["Span"] = None,
+                 sampled: bool = True,
+                 **attrs: Any) -> None:
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(8)
+        self.span_id = secrets.token_hex(4)
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.attrs = attrs
+        self.sampled = sampled
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.error: Optional[str] = None
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.started_at,
+            "duration_ms": round((time.perf_counter() - self._started) * 1000,
+                                 3),
+            "attrs": self.attrs,
+            "error": self.error,
+        }
+
+
+# asyncio tasks copy the context when created, so spans propagate into them
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    "chorok_span", default=None)
+
+
+class JSONLinesExporter:
+    def __init__(self,
+                 path: str,
+                 max_bytes: int = 10 * 1024 * 1024,
+                 backup_count: int = 3,
+                 buffer_size: int = 10000,
+                 flush_interval: float = 5.0) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+
+        self.logger = logging.getLogger("tracing")
+        self.dropped = 0
+        self._buffer: list[dict[str, Any]] = []
+
+    def export(self, record: dict[str, Any]) -> None:
+        if len(self._buffer) >= self.buffer_size:
+            self.dropped += 1
+            return
+        self._buffer.append(record)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except OSError as exc:
+                self.logger.warning(f"failed to write spans: {exc}")
+
+    async def flush(self) -> None:
+        records, self._buffer = self._buffer, []
+        if records:
+            await asyncio.get_event_loop().run_in_executor(
+                None, self._write, records)
+
+    def _rotate(self) -> None:
+        for index in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        if self.backup_count:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def _write(self, records: list[dict[str, Any]]) -> None:
+        if os.path.exists(
+                self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            self._rotate()
+
+        with open(self.path, "a") as fp:
+            fp.write("".join(
+                json.dumps(record, default=str) + "\n" for record in records))
+
+
+class Tracer:
+    def __init__(self) -> None:
+        self.sample_rate = 0.0
+        self.exporter: Optional[JSONLinesExporter] = None
+
+    def configure(self,
+                  loop: asyncio.AbstractEventLoop,
+                  enabled: bool = False,
+                  path: str = "traces.jsonl",
+                  sample_rate: float = 0.01,
+                  **exporter_options: Any) -> None:
+        if not enabled:
+            self.exporter = None
+            return
+
+        self.sample_rate = sample_rate
+        self.exporter = JSONLinesExporter(path, **exporter_options)
+        loop.create_task(self.exporter.run())
+
+    def metric(self, name: str, **values: Any) -> None:
+        # metrics are not sampled, they are written once per reporting window
+        if self.exporter is not None:
+            self.exporter.export({
+                "metric": name,
+                "time": time.time(),
+                "values": values
+            })
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[Optional[Span]]:
+        parent = _current.get()
+        if parent is None:
+            if self.exporter is None:
+                yield None
+                return
+            sampled = random.random() < self.sample_rate
+        else:
+            sampled = parent.sampled
+
+        span = Span(name, parent, sampled, **attrs)
+        token = _current.set(span)
+        try:
+            yield span if sampled else None
+        except BaseException as exc:
+            span.error = repr(exc)
+            raise
+        finally:
+            _current.reset(token)
+            if sampled and self.exporter is not None:
+                self.exporter.export(span.to_dict())
+
+
+tracer = Tracer()
+span = tracer.span
+
+
+def traced(
+    name: str
+) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    def decorator(
+            func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            with span(name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextlib.contextmanager
+def detached() -> Iterator[None]:
+    # tasks copy the context they are created in, long-lived ones must not keep the current span
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
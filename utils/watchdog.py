@@ -0,0 +1,84 @@
+import asyncio
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from .tracing import tracer
+
+
+class LoopWatchdog:
+    """
+    Measures the event loop lag with a ticking task, and captures the stack of the loop thread
+    from a separate thread when the loop is blocked for longer than ``threshold``.
+    """
+    def __init__(self,
+                 loop: asyncio.AbstractEventLoop,
+                 tick: float = 0.1,
+                 threshold: float = 0.5,
+                 window: float = 60.0) -> None:
+        self.loop = loop
+        self.tick = tick
+        self.threshold = threshold
+        self.window = window
+
+        self.logger = logging.getLogger("watchdog")
+        self.lags: collections.deque[float] = collections.deque(
+            maxlen=max(1, int(window / tick)))
+        self.blocked = 0
+        self._beat = time.monotonic()
+        self._stall: Optional[tuple[float, str]] = None
+        self._loop_thread: Optional[int] = None
+
+    def start(self) -> None:
+        self.loop.create_task(self._run())
+        self.loop.create_task(self._report())
+
+    async def _run(self) -> None:
+        self._loop_thread = threading.get_ident()
+        threading.Thread(target=self._watch, name="loop-watchdog",
+                         daemon=True).start()
+
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.tick)
+            self._beat = time.monotonic()
+            self.lags.append(max(0.0, self._beat - started - self.tick))
+
+            if self._stall is not None:
+                (stalled_at, stack), self._stall = self._stall, None
+                self.blocked += 1
+                self.logger.warning(
+                    f"event loop was blocked for {round((self._beat - stalled_at) * 1000)}ms at\n{stack}"
+                )
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self.tick)
+            beat = self._beat
+            if self._stall is not None or time.monotonic(
+            ) - beat < self.threshold:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread or 0)
+            if frame is not None:
+                self._stall = (beat, "".join(traceback.format_stack(frame)))
+
+    def stats(self) -> dict[str, float]:
+        lags = sorted(self.lags)
+        if not lags:
+            return {"p50": 0.0, "p99": 0.0, "max": 0.0, "blocked": 0}
+        return {
+            "p50": lags[len(lags) // 2],
+            "p99": lags[min(len(lags) - 1, int(len(lags) * 0.99))],
+            "max": lags[-1],
+            "blocked": self.blocked,
+        }
+
+    async def _report(self) -> None:
+        while True:
+            await asyncio.sleep(self.window)
+            tracer.metric("loop.lag", **self.stats())